@@ -0,0 +1,47 @@
+from __future__ import annotations  # for Python 3.7-3.9
+
+import sys
+
+
+class SyncError(Exception):
+    """ Fatal error in main. exit_code is used as the exit status of the script """
+
+    def __init__(self, message: str, exit_code: int):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+def mikrotik_exit_codes() -> dict[type, int]:
+    """
+    :return: Dict of MikrotikError class -> exit status of the script. Empty if Mikrotik.py has not been imported.
+    Mikrotik.py is looked up instead of imported since importing it pulls in pyserial.
+    """
+    mikrotik = sys.modules.get('Mikrotik')
+    if mikrotik is None:
+        return {}
+    return {
+        mikrotik.MikrotikConnectionError: -15,
+        mikrotik.MikrotikLoginError: -15,
+        mikrotik.MikrotikTimeoutError: -40,
+        mikrotik.MikrotikStallError: -41,
+        mikrotik.MikrotikError: -50,
+    }
+
+
+def run(entry_point, *args):
+    """
+    Run entry_point and convert errors into exit codes for cron and devd
+    """
+    try:
+        entry_point(*args)
+    except SyncError as e:
+        print(e)
+        sys.exit(e.exit_code)
+    except Exception as e:
+        # Any MikrotikError is raised after Mikrotik.py was imported, so it is in sys.modules by now
+        exit_codes = mikrotik_exit_codes()
+        error_class = next((error_class for error_class in type(e).__mro__ if error_class in exit_codes), None)
+        if error_class is None:
+            raise
+        print(f"{type(e).__name__}: {e}")
+        sys.exit(exit_codes[error_class])
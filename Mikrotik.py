@@ -9,6 +9,7 @@ import re
 
 from Shared import DNSRecord
 from Shared import DHCPLease
+from Shared import FingerprintHelper
 from Shared import RegexHelper
 
 
@@ -30,6 +31,36 @@ def on_login_or_terminal_prompt(data):
         return False
 
 
+class MikrotikError(Exception):
+    """ Base class for errors raised by MikrotikDevice """
+
+
+class MikrotikConnectionError(MikrotikError):
+    """ The serial port could not be opened """
+
+
+class MikrotikLoginError(MikrotikError):
+    """ Login failed, or RouterOS dropped back to the login prompt mid-session """
+
+
+class MikrotikTimeoutError(MikrotikError):
+    """ The expected prompt did not appear before the command deadline """
+
+    def __init__(self, message: str, resynced: bool = False):
+        super().__init__(message)
+        self.resynced = resynced
+        """ True if the console was brought back to the terminal prompt afterwards (See MikrotikDevice._resync) """
+
+
+class MikrotikStallError(MikrotikError):
+    """ RouterOS stopped at a pager or confirmation prompt instead of returning to the terminal prompt """
+
+    def __init__(self, message: str, resynced: bool = False):
+        super().__init__(message)
+        self.resynced = resynced
+        """ True if the console was brought back to the terminal prompt afterwards (See MikrotikDevice._resync) """
+
+
 class MikrotikDHCPLease(DHCPLease):
     """
     | -----------------
@@ -68,71 +99,183 @@ class MikrotikDNSRecord(DNSRecord):
     comment: str
 
 
-class MikrotikDevice:
-    _serial_port: Serial = None
-    _logged_in: bool = False
+class RouterOSExportParser:
+    """
+    Single pass parser for the console output of RouterOS 'export' and 'export terse'.
 
-    def get_static_dns_records(self) -> list[MikrotikDNSRecord]:
-        """
+    | Rows are split on section paths and verbs rather than lines, so terse rows ('/ip dns static add ...'),
+    | section blocks ('/ip dns static' followed by 'add ...' lines), '\' line continuations and lines wrapped by the
+    | console are all handled. Comments, prompts and the echoed command are skipped.
+    """
 
-        :return: List of Unique MikrotikDNSRecord dicts
+    _token = re.compile(r"""
+          (?P<comment>\#[^\r\n]*)
+        | (?P<prompt>\[[^\]\r\n@]*@[^\]\r\n]*\][^\r\n]*)
+        | (?P<continuation>\\\r?\n)
+        | (?P<path>/[\w-]+(?:[ /](?!(?:add|set|remove)(?:\s|$))[\w-]+(?![\w.-]*=))*)
+        | (?P<verb>(?:add|set|remove)(?=\s|$))
+        | (?P<key>[\w.-]+(?:\r?\n[\w.-]+)*)=(?P<value>(?:\\\r?\n(?![ \t]*[\w.-]+=)[ \t]*)*
+            (?:"(?:[^"\\]|\\[\s\S])*"
+            |(?:\\\r?\n(?![ \t]*[\w.-]+=)[ \t]*|[^\s"\\\[]|\\[^\r\n]|\r?\n(?![\s/\#\[]|(?:add|set|remove)\s))*))
+        | (?P<find>\[[^\]]*\])
+        | (?P<space>\s+)
+        | (?P<other>\S+)
+        """, re.VERBOSE)
+
+    _continuation = re.compile(r'\\\r?\n[ \t]*')
+    _escape = re.compile(r'\\([0-9A-Fa-f]{2}|.)', re.DOTALL)
+    _escapes = {'n': '\n', 'r': '\r', 't': '\t', '_': ' ', 'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v'}
+
+    @staticmethod
+    def _unescape_match(match) -> str:
+        escaped = match.group(1)
+        if len(escaped) == 2:
+            return chr(int(escaped, 16))
+        return RouterOSExportParser._escapes.get(escaped, escaped)
+
+    @staticmethod
+    def parse_value(value: str) -> str:
         """
-        print("RouterOS: Importing Reserved DNS Records")
-        reserved_dns_records: list[MikrotikDNSRecord] = []
-        start_index = 0
+        :param value: Raw value as it appears in the export. Quotes and escapes are removed.
+        """
+        if "\n" in value:
+            # Continued with '\' or wrapped by the console
+            value = RouterOSExportParser._continuation.sub("", value)
+            value = value.replace("\r\n", "").replace("\n", "")
+        if value.startswith('"') and value.endswith('"') and len(value) > 1:
+            value = value[1:-1]
+        if "\\" in value:
+            value = RouterOSExportParser._escape.sub(RouterOSExportParser._unescape_match, value)
+        return value
+
+    @staticmethod
+    def iter_rows(export: str):
+        r"""
+        :param export: Console output of an export command
+        :return: Iterator of (section, verb, fields) tuples. section is in the '/ip/dns/static' form and fields is a
+        dict of key -> unescaped value
+
+        '\' continuations may follow the '=', split a value, or end a value before the next key. LF or CRLF.
+
+        >>> list(RouterOSExportParser.iter_rows('/ip dhcp-server lease\n'
+        ...                                     'add comment=\\\n    "a b" mac-address=\\\n'
+        ...                                     '    AA:BB:CC:DD:EE:FF\n'))
+        [('/ip/dhcp-server/lease', 'add', {'comment': 'a b', 'mac-address': 'AA:BB:CC:DD:EE:FF'})]
+        >>> list(RouterOSExportParser.iter_rows('/ip dns static\r\n'
+        ...                                     'add address=10.0.0.8\\\r\n    name=long\\\r\n    name.lan\r\n'))
+        [('/ip/dns/static', 'add', {'address': '10.0.0.8', 'name': 'longname.lan'})]
+        """
+        section = ""
+        verb = None
+        fields: dict[str, str] = {}
+        for match in RouterOSExportParser._token.finditer(export):
+            kind = match.lastgroup
+            if kind == 'key' or kind == 'value':
+                if verb is not None:
+                    key = match.group('key')
+                    if "\n" in key:
+                        # Wrapped by the console
+                        key = key.replace("\r", "").replace("\n", "")
+                    fields[key] = RouterOSExportParser.parse_value(match.group('value'))
+            elif kind == 'path' or kind == 'verb' or kind == 'comment' or kind == 'prompt':
+                if verb is not None:
+                    yield section, verb, fields
+                    verb, fields = None, {}
+                if kind == 'path':
+                    section = match.group('path').replace(" ", "/")
+                elif kind == 'verb':
+                    verb = match.group('verb')
+
+        if verb is not None:
+            yield section, verb, fields
+
+    @staticmethod
+    def parse(export: str, section: str, row_factory) -> list:
+        """
+        :param export: Console output of an export command
+        :param section: Section to parse rows from, in the '/ip/dns/static' form
+        :param row_factory: Callable converting the fields dict of an 'add' row into a record
+        :return: List of unique records built by row_factory, in export order
+        """
+        seen = set()
+        records = []
+        for row_section, verb, fields in RouterOSExportParser.iter_rows(export):
+            if row_section == section and verb == 'add':
+                record = row_factory(fields)
+                key = tuple(record.values())
+                if key not in seen:
+                    seen.add(key)
+                    records.append(record)
+        return records
+
+    @staticmethod
+    def parse_duration(value: str) -> timedelta:
+        """
+        :param value: RouterOS time value. I.E, '2h', '1d2h30m', '1w', '02:00:00' or plain seconds
+        """
+        if ":" in value:
+            hours, minutes, seconds = value.split(":")
+            return timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+        if value.isdigit():
+            return timedelta(seconds=int(value))
 
-        items = re.split('/ip dns static add', self.send_command("/ip/dns/static export terse").replace("\r\n", ""))
-        # Remove whitespace and find starting index
-        for index, item in enumerate(items):
-            # Strip out any leading or trailing whitespace
-            items[index] = item.strip()
-            if 'software id' in item:
-                start_index = index + 1
+        parts = RegexHelper.duration_parts.findall(value)
+        if not parts or "".join(number + unit for number, unit in parts) != value:
+            print("WARNING: Couldn't parse lease duration time unit. Assuming it is in hours.")
+            return timedelta(hours=int(value[:-1]))
 
-        # Cut off the trailing garbage on the last line
-        items[-1] = items[-1][:items[-1].find("\r")]
-        items = items[start_index:]
+        units = {'w': 'weeks', 'd': 'days', 'h': 'hours', 'm': 'minutes', 's': 'seconds'}
+        return timedelta(**{units[unit]: int(number) for number, unit in parts})
 
-        for item in items:
-            parsed_item = RegexHelper.convert_kv_string_to_dict(item)
 
-            # TODO: Add if/else vs try/except performance tweak from DHCP?
-            try:
-                ip_address = parsed_item['address']
-            except KeyError:
-                ip_address = "0.0.0.0"
+class MikrotikDevice:
+    _serial_port: Serial = None
+    _logged_in: bool = False
 
-            try:
-                hostname = parsed_item['name']
-            except KeyError:
-                hostname = ""
+    def __init__(self, command_timeout_seconds: float = 30, export_timeout_seconds: float = 300,
+                 resync_attempts: int = 3):
+        """
+        :param command_timeout_seconds: Deadline for the prompt to reappear after a command
+        :param export_timeout_seconds: Deadline for commands that transfer whole tables, like export and import
+        :param resync_attempts: How many times to try to get back to the terminal prompt after a timeout or stall
+        """
+        self.command_timeout_seconds = command_timeout_seconds
+        self.export_timeout_seconds = export_timeout_seconds
+        self.resync_attempts = resync_attempts
 
-            try:
-                record_type = parsed_item['type']
-            except KeyError:
-                record_type = "A"
+    def get_static_dns_records(self) -> list[MikrotikDNSRecord]:
+        """
 
-            try:
-                disabled = True if parsed_item['disabled'] == 'yes' else False
-            except KeyError:
-                disabled = False
+        :return: List of Unique MikrotikDNSRecord dicts
+        """
+        print("RouterOS: Importing Reserved DNS Records")
+        return self.parse_static_dns_export(self.send_command("/ip/dns/static export terse",
+                                                              timeout=self.export_timeout_seconds,
+                                                              read_only=True))
 
-            try:
-                comment = parsed_item['comment']
-            except KeyError:
-                comment = ""
+    @staticmethod
+    def parse_static_dns_export(export: str) -> list[MikrotikDNSRecord]:
+        """
+        Parse the console output of '/ip/dns/static export terse'
 
-            reserved_dns_record = MikrotikDNSRecord(ip_address=ip_address,
-                                                    hostname=hostname,
-                                                    record_type=record_type,
-                                                    disabled=disabled,
-                                                    comment=comment)
-            if reserved_dns_record not in reserved_dns_records:
-                reserved_dns_records.append(reserved_dns_record)
+        :return: List of Unique MikrotikDNSRecord dicts
+        """
+        return RouterOSExportParser.parse(export, "/ip/dns/static", MikrotikDevice._dns_record_from_row)
 
-        return reserved_dns_records
+    @staticmethod
+    def _dns_record_from_row(row: dict) -> MikrotikDNSRecord:
+        return MikrotikDNSRecord(ip_address=row.get('address', "0.0.0.0"),
+                                 hostname=row.get('name', ""),
+                                 record_type=row.get('type', "A"),
+                                 disabled=row.get('disabled') == 'yes',
+                                 comment=row.get('comment', ""))
 
     def write_static_dns_record(self, record: MikrotikDNSRecord):
+        self.send_command(self.static_dns_add_command(record))
+        return True
+
+    @staticmethod
+    def static_dns_add_command(record: MikrotikDNSRecord) -> str:
         command = "/ip/dns/static/add"
 
         if record['ip_address']:
@@ -145,10 +288,8 @@ class MikrotikDevice:
             command += f" disabled=yes"
         if record['comment']:
             command += f" comment=\"{record['comment']}\""
-        command += "]"
 
-        self.send_command(command)
-        return True
+        return command
 
     def remove_static_dns_record(self, record: MikrotikDNSRecord):
         command = f"/ip/dns/static/remove [find"
@@ -165,7 +306,8 @@ class MikrotikDevice:
             command += f" comment=\"{record['comment']}\""
         command += "]"
         # Sanity check
-        assert command != "/ip/dns/static/remove [find]"
+        if command == "/ip/dns/static/remove [find]":
+            raise ValueError("Refusing to remove every static DNS record. record has no fields set")
 
         self.send_command(command)
         return True
@@ -174,94 +316,91 @@ class MikrotikDevice:
         command = f"/ip/dns/static/remove [find comment~\"{message}\"]"
         self.send_command(command)
 
-    def get_reserved_dhcp_leases(self) -> list[MikrotikDHCPLease]:
-        """
-        Get all 'manually' added DHCP leases. I.E, Get leases not predefined or preconfigured.
-        :returns: List of Unique MikrotikDHCPLease dict
+    def get_static_dns_fingerprint(self, message: str) -> str | None:
         """
-        print("Importing RouterOS DHCP Leases")
+        Have RouterOS list only the canonical fields of static DNS records with a comment containing message and
+        fingerprint them. This is much cheaper than a full export.
 
-        reserved_dhcp_leases: list[MikrotikDHCPLease] = []
-        start_index = 0
-        items = re.split('/ip dhcp-server lease add',
-                         self.send_command("/ip/dhcp-server/lease export terse").replace("\r\n", ""))
+        :return: Fingerprint string (See FingerprintHelper.fingerprint) or None if the output could not be verified
+        """
+        print("RouterOS: Fingerprinting Static DNS Records")
+        find = f"[/ip/dns/static/find comment~\"{message}\"]"
+        command = f":put (\"fp-count|\" . [:len {find}]); " \
+                  f":foreach i in={find} do={{" \
+                  f":local t [/ip/dns/static/get $i type]; :if ([:len $t] = 0) do={{:set t \"A\"}}; " \
+                  f":put (\"fp|\" . [/ip/dns/static/get $i name] . \"|\" . [/ip/dns/static/get $i address] " \
+                  f". \"|\" . $t)}}"
+
+        def build_key(fields: list[str]) -> str:
+            return FingerprintHelper.dns_record_key(DNSRecord(hostname=fields[0],
+                                                              ip_address=fields[1],
+                                                              record_type=fields[2]))
+
+        # The output grows with the number of records, so use the export deadline
+        output = self.send_command(command, timeout=self.export_timeout_seconds, read_only=True)
+        return self._parse_fingerprint_output(output, build_key)
+
+    def get_static_dns_hashes(self, message: str) -> dict[str, list[str]]:
+        """
+        Fetch only the .id and comment of static DNS records with a comment containing message.
 
-        # Remove whitespace and find starting index
-        for index, item in enumerate(items):
-            # Strip out any leading or trailing whitespace
-            items[index] = item.strip()
-            if 'software id' in item:
-                start_index = index + 1
+        :return: Dict of content hash tag -> list of RouterOS .id. Records without a hash tag are keyed by ''
+        """
+        print("RouterOS: Importing Static DNS Record Hashes")
+        return self._get_hashes("/ip/dns/static", message)
 
-        # Cut off the trailing garbage on the last line
-        items[-1] = items[-1][:items[-1].find("\r")]
-        items = items[start_index:]
+    def remove_static_dns_by_id(self, ids: list[str]):
+        self._remove_by_id("/ip/dns/static", ids)
 
-        for item in items:
-            parsed_item = RegexHelper.convert_kv_string_to_dict(item)
-            keys = parsed_item.keys()
+    def remove_static_dns_by_hash(self, record_hashes: list[str]):
+        self._remove_by_hash("/ip/dns/static", record_hashes)
 
-            # If statements are sometimes more performant than try/except when
-            # value is likely to be present. Try/except is good when KeyError is unlikely (Like on the mac address key)
+    def get_reserved_dhcp_leases(self) -> list[MikrotikDHCPLease]:
+        """
+        Get all 'manually' added DHCP leases. I.E, Get leases not predefined or preconfigured.
+        :returns: List of Unique MikrotikDHCPLease dict
+        """
+        print("Importing RouterOS DHCP Leases")
+        return self.parse_reserved_dhcp_export(self.send_command("/ip/dhcp-server/lease export terse",
+                                                                 timeout=self.export_timeout_seconds,
+                                                                 read_only=True))
 
-            if 'mac-address' not in keys and 'client-id' not in keys:
-                raise KeyError("mac or hostname must be present")
+    @staticmethod
+    def parse_reserved_dhcp_export(export: str) -> list[MikrotikDHCPLease]:
+        """
+        Parse the console output of '/ip/dhcp-server/lease export terse'
 
-            try:
-                mac_address = parsed_item['mac-address']
-            except KeyError:
-                mac_address = ""
+        :returns: List of Unique MikrotikDHCPLease dict
+        """
+        return RouterOSExportParser.parse(export, "/ip/dhcp-server/lease", MikrotikDevice._dhcp_lease_from_row)
 
-            try:
-                ip_address = parsed_item['address']
-            except KeyError:
-                # Value not used. Assume system default is used.
-                # RouterOS default is to use a dynamic IP assignment for MAC if no IP is provided in the config
-                # RouterOS uses an IP of 0.0.0.0 to indicate dynamic assignment
-                ip_address = "0.0.0.0"
+    @staticmethod
+    def _dhcp_lease_from_row(row: dict) -> MikrotikDHCPLease:
+        if 'mac-address' not in row and 'client-id' not in row:
+            raise KeyError("mac or hostname must be present")
 
-            try:
-                hostname = parsed_item['client-id']
-            except KeyError:
-                hostname = ""
-
-            if 'disabled' in keys:
-                disabled = True if parsed_item['disabled'] == 'yes' else False
-            else:
-                disabled = False
-
-            comment = parsed_item['comment'] if 'comment' in keys else ""
-
-            if 'lease-time' in keys:
-                lease_duration = parsed_item['lease-time']
-                if lease_duration[-1] == "s":
-                    lease_duration = timedelta(seconds=int(lease_duration[:-1]))
-                elif lease_duration[-1] == "m":
-                    lease_duration = timedelta(minutes=int(lease_duration[:-1]))
-                elif lease_duration[-1] == "h":
-                    lease_duration = timedelta(hours=int(lease_duration[:-1]))
-                elif lease_duration[-1] == "d":
-                    lease_duration = timedelta(days=int(lease_duration[:-1]))
-                else:
-                    print("WARNING: Couldn't parse lease duration time unit. Assuming it is in hours.")
-                    lease_duration = timedelta(hours=int(lease_duration[:-1]))
-            else:
-                # If not set, the default is being used. 0 duration indicates default. (10 minutes for ipv4 OOB)
-                lease_duration = timedelta(seconds=0)
-
-            reserved_dhcp_lease = MikrotikDHCPLease(mac_address=mac_address,
-                                                    hostname=hostname,
-                                                    ip_address=ip_address,
-                                                    lease_duration=lease_duration,
-                                                    disabled=disabled,
-                                                    comment=comment)
-            if reserved_dhcp_lease not in reserved_dhcp_leases:
-                reserved_dhcp_leases.append(reserved_dhcp_lease)
-
-        return reserved_dhcp_leases
+        if 'lease-time' in row:
+            lease_duration = RouterOSExportParser.parse_duration(row['lease-time'])
+        else:
+            # If not set, the default is being used. 0 duration indicates default. (10 minutes for ipv4 OOB)
+            lease_duration = timedelta(seconds=0)
+
+        # RouterOS default is to use a dynamic IP assignment for MAC if no IP is provided in the config
+        # RouterOS uses an IP of 0.0.0.0 to indicate dynamic assignment
+        return MikrotikDHCPLease(mac_address=row.get('mac-address', ""),
+                                 hostname=row.get('client-id', ""),
+                                 ip_address=row.get('address', "0.0.0.0"),
+                                 lease_duration=lease_duration,
+                                 disabled=row.get('disabled') == 'yes',
+                                 comment=row.get('comment', ""))
 
     # TODO: Create exception cases for potential failures
     def write_reserved_dhcp_lease(self, lease: MikrotikDHCPLease):
+        self.send_command(self.dhcp_lease_add_command(lease))
+        return True
+
+    @staticmethod
+    def dhcp_lease_add_command(lease: MikrotikDHCPLease) -> str:
         command = "/ip/dhcp-server/lease/add"
 
         command += f" mac-address=\"{lease['mac_address']}\""
@@ -274,8 +413,7 @@ class MikrotikDevice:
         command += f" lease-time={int(lease['lease_duration'].total_seconds())}"
         command += f" comment=\"{lease['comment']}\""
 
-        self.send_command(command)
-        return True
+        return command
 
     # TODO: Create exception cases for potential failures
     def remove_reserved_dhcp_lease(self, lease: MikrotikDHCPLease):
@@ -295,7 +433,8 @@ class MikrotikDevice:
             command += f" comment=\"{lease['comment']}\""
         command += "]"
         # Sanity check
-        assert command != "/ip/dhcp-server/lease/remove [find]"
+        if command == "/ip/dhcp-server/lease/remove [find]":
+            raise ValueError("Refusing to remove every DHCP lease. lease has no fields set")
 
         self.send_command(command)
         return True
@@ -304,14 +443,200 @@ class MikrotikDevice:
         command = f"/ip/dhcp-server/lease/remove [find comment~\"{message}\"]"
         self.send_command(command)
 
-    def send_command(self, command: str, look_for='terminal'):
+    def get_reserved_dhcp_fingerprint(self, message: str) -> str | None:
+        """
+        Have RouterOS list only the canonical fields of DHCP leases with a comment containing message and
+        fingerprint them. This is much cheaper than a full export.
+
+        :return: Fingerprint string (See FingerprintHelper.fingerprint) or None if the output could not be verified
+        """
+        print("RouterOS: Fingerprinting DHCP Leases")
+        find = f"[/ip/dhcp-server/lease/find comment~\"{message}\"]"
+        command = f":put (\"fp-count|\" . [:len {find}]); " \
+                  f":foreach i in={find} do={{" \
+                  f":put (\"fp|\" . [/ip/dhcp-server/lease/get $i mac-address] " \
+                  f". \"|\" . [/ip/dhcp-server/lease/get $i address] " \
+                  f". \"|\" . [:tonum [/ip/dhcp-server/lease/get $i lease-time]])}}"
+
+        def build_key(fields: list[str]) -> str:
+            return FingerprintHelper.dhcp_lease_key(DHCPLease(mac_address=fields[0],
+                                                              ip_address=fields[1],
+                                                              hostname="",
+                                                              lease_duration=timedelta(seconds=int(fields[2]))))
+
+        # The output grows with the number of records, so use the export deadline
+        output = self.send_command(command, timeout=self.export_timeout_seconds, read_only=True)
+        return self._parse_fingerprint_output(output, build_key)
+
+    def get_reserved_dhcp_hashes(self, message: str) -> dict[str, list[str]]:
+        """
+        Fetch only the .id and comment of DHCP leases with a comment containing message.
+
+        :return: Dict of content hash tag -> list of RouterOS .id. Leases without a hash tag are keyed by ''
+        """
+        print("RouterOS: Importing DHCP Lease Hashes")
+        return self._get_hashes("/ip/dhcp-server/lease", message)
+
+    def remove_reserved_dhcp_by_id(self, ids: list[str]):
+        self._remove_by_id("/ip/dhcp-server/lease", ids)
+
+    def remove_reserved_dhcp_by_hash(self, record_hashes: list[str]):
+        self._remove_by_hash("/ip/dhcp-server/lease", record_hashes)
+
+    def _get_hashes(self, menu: str, message: str) -> dict[str, list[str]]:
+        command = f":foreach i in=[{menu}/find comment~\"{message}\"] do={{" \
+                  f":put (\"id|\" . $i . \"|\" . [{menu}/get $i comment])}}"
+
+        hashes: dict[str, list[str]] = {}
+        for line in self.send_command(command, timeout=self.export_timeout_seconds, read_only=True).splitlines():
+            line_match = FingerprintHelper.id_comment_line.match(line.strip())
+            if line_match:
+                hash_match = FingerprintHelper.hash_tag.search(line_match.group(2))
+                record_hash = hash_match.group(1) if hash_match else ""
+                hashes.setdefault(record_hash, []).append(line_match.group(1))
+
+        return hashes
+
+    def _remove_by_id(self, menu: str, ids: list[str], batch_size: int = 50):
+        # Batch the ids to keep the console line length reasonable
+        for index in range(0, len(ids), batch_size):
+            self.send_command(f"{menu}/remove numbers={','.join(ids[index:index + batch_size])}",
+                              timeout=self.export_timeout_seconds)
+
+    def _remove_by_hash(self, menu: str, record_hashes: list[str], batch_size: int = 50):
+        # Does not depend on .ids, which go stale if a record is removed and re-added by hand
+        for index in range(0, len(record_hashes), batch_size):
+            batch = "|".join(record_hashes[index:index + batch_size])
+            self.send_command(f"{menu}/remove [find comment~\"hash:({batch})\"]", timeout=self.export_timeout_seconds)
+
+    @staticmethod
+    def _parse_fingerprint_output(output: str, build_key) -> str | None:
+        """
+        Parse the output of a RouterOS fingerprint script.
+
+        :param output: Console output of the fingerprint script
+        :param build_key: Callable converting the '|' separated fields of a record line into a canonical key
+        :return: Fingerprint string or None if the count is missing, the count does not match the number of records
+        read, or duplicate records exist on RouterOS
+        """
+        count = None
+        keys: list[str] = []
+        for line in output.splitlines():
+            line = line.strip()
+            count_match = FingerprintHelper.fingerprint_count.match(line)
+            if count_match:
+                count = int(count_match.group(1))
+                continue
+            line_match = FingerprintHelper.fingerprint_line.match(line)
+            if line_match:
+                try:
+                    keys.append(build_key(line_match.group(1).split("|")))
+                except (IndexError, ValueError):
+                    # Mangled line. Most likely the echoed command wrapped at an unfortunate spot.
+                    return None
+
+        if count is None or count != len(keys) or len(set(keys)) != len(keys):
+            return None
+
+        return FingerprintHelper.fingerprint(keys)
+
+    def import_script(self, file_name: str, script: str, chunk_bytes: int = 4000) -> bool:
+        """
+        Transfer script to RouterOS as files and run them in order with /import. The files are removed afterwards.
+        Many RouterOS releases cap the contents set with '/file/set' at 4 KB, so the script is split on line boundaries
+        into files of at most chunk_bytes each. The length of every file is read back before anything is imported.
+        The files are created with '/file/print file=' since '/file/add' is not available on older RouterOS 7 releases.
+
+        :param file_name: Name prefix of the files on RouterOS, without extension. '.txt' is appended by RouterOS.
+        :param script: RouterOS script (.rsc) content
+        :param chunk_bytes: Maximum size of each file
+        :return: True if every file was transferred intact and RouterOS reports each was executed successfully,
+        False otherwise
+        """
+        chunks = self.split_script(script, chunk_bytes)
+        file_names = [f"{file_name}-{index}" for index in range(len(chunks))]
+        try:
+            for chunk_file_name, chunk in zip(file_names, chunks):
+                if not self._write_file(chunk_file_name, chunk):
+                    print(f"RouterOS: {chunk_file_name}.txt was not written intact")
+                    return False
+
+            for chunk_file_name in file_names:
+                res = self.send_command(f"/import file-name={chunk_file_name}.txt",
+                                        timeout=self.export_timeout_seconds)
+                if "Script file loaded and executed successfully" not in res:
+                    return False
+            return True
+        finally:
+            # Best effort. A failed cleanup must not replace the error that ended the transfer or import.
+            try:
+                for chunk_file_name in file_names:
+                    self.send_command(f"/file/remove [find name=\"{chunk_file_name}.txt\"]")
+            except MikrotikError as e:
+                print(f"RouterOS: Could not remove {file_name}-*.txt. {type(e).__name__}: {e}")
+
+    def _write_file(self, file_name: str, contents: str) -> bool:
+        """
+        Create file_name.txt on RouterOS with contents
+
+        :return: True if the size of the file on RouterOS matches contents
+        """
+        self.send_command(f"/file/print file={file_name}")
+        self.send_command(f"/file/set {file_name}.txt contents=\"{self.escape_string(contents)}\"")
+        res = self.send_command(f":put (\"file-size|\" . [/file/get {file_name}.txt size])", read_only=True)
+        size_match = RegexHelper.file_size.search(res)
+        return size_match is not None and int(size_match.group(1)) == len(contents.encode())
+
+    @staticmethod
+    def split_script(script: str, chunk_bytes: int) -> list[str]:
+        """
+        Split script on line boundaries into chunks of at most chunk_bytes. A line longer than chunk_bytes gets a
+        chunk of its own.
+        """
+        chunks = []
+        chunk = ""
+        for line in script.splitlines(keepends=True):
+            if chunk and len((chunk + line).encode()) > chunk_bytes:
+                chunks.append(chunk)
+                chunk = ""
+            chunk += line
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    def escape_string(value: str) -> str:
+        """
+        :return: value escaped for use inside a double-quoted RouterOS string
+        """
+        for character, escaped in (("\\", "\\\\"), ("\"", "\\\""), ("$", "\\$"), ("?", "\\?"),
+                                   ("\r", "\\r"), ("\n", "\\n"), ("\t", "\\t")):
+            value = value.replace(character, escaped)
+        return value
+
+    def send_command(self, command: str, look_for='terminal', timeout: float = None, read_only: bool = False):
+        """
+        :param command: Command to send
+        :param look_for: Prompt that ends the command output. 'terminal' or 'login'
+        :param timeout: Deadline in seconds. Defaults to command_timeout_seconds
+        :param read_only: The command does not change RouterOS state. It is sent once more if the read times out or
+        stalls and the console is resynchronized. Commands that change state are never re-sent.
+        :raises MikrotikTimeoutError: The prompt did not appear before the deadline
+        :raises MikrotikStallError: RouterOS stopped at a pager or confirmation prompt
+        :raises MikrotikLoginError: RouterOS returned to the login prompt while a terminal prompt was expected
+        """
         self._write(command)
+        try:
+            return self._read(read_type=look_for, timeout=timeout)
+        except (MikrotikTimeoutError, MikrotikStallError) as e:
+            if not read_only or not e.resynced:
+                raise
+            print(f"{type(e).__name__}: {e}. Sending the command again")
 
-        ret = self._read(read_type=look_for)
-        return ret
+        self._write(command)
+        return self._read(read_type=look_for, timeout=timeout)
 
-    # TODO: ADD TIMEOUT
-    def _read(self, read_type='terminal') -> str | bool:
+    def _read(self, read_type='terminal', timeout: float = None) -> str:
         print(f"=== BEGIN READ ===")
 
         if read_type == 'terminal':
@@ -322,26 +647,82 @@ class MikrotikDevice:
             raise ValueError(f"{read_type} is not valid for expected_prompt parameter. "
                              f"Valid parameter values are 'terminal' or 'login'")
 
+        deadline = time.monotonic() + (timeout if timeout is not None else self.command_timeout_seconds)
+        try:
+            polished_read_result = self._read_until(expected_prompt, deadline, detect_stalls=True,
+                                                    detect_logout=read_type == 'terminal')
+        except MikrotikError:
+            print("")
+            print(f"=== END READ ===")
+            raise
+
+        print("")
+        print(polished_read_result)
+        self._serial_port.flushInput()
+        print(f"=== END READ ===")
+        return polished_read_result
+
+    def _read_until(self, expected_prompt, deadline: float, detect_stalls: bool, detect_logout: bool) -> str:
+        """
+        Read until expected_prompt returns True for the output read so far.
+
+        :param expected_prompt: Callable taking the output read so far
+        :param deadline: time.monotonic() value to give up at
+        :param detect_stalls: Raise MikrotikStallError on pager and confirmation prompts
+        :param detect_logout: Raise MikrotikLoginError when the login prompt appears
+        """
         # Reminder: System latency timer changed to 1ms
         read_attempt = 0
         ansi_escape = re.compile(r'(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]')
         polished_read_result = ''
         while not expected_prompt(polished_read_result):
+            if time.monotonic() > deadline:
+                resynced = self._resync() if detect_stalls else False
+                raise MikrotikTimeoutError(f"Prompt not found before deadline. Resynchronized: {resynced}. "
+                                           f"Output: {polished_read_result[-200:]!r}", resynced)
+
+            last_line = polished_read_result.splitlines()[-1] if polished_read_result else ''
+            if detect_logout and "Login:" in last_line:
+                self._logged_in = False
+                raise MikrotikLoginError(f"RouterOS returned to the login prompt. "
+                                         f"Output: {polished_read_result[-200:]!r}")
+            if detect_stalls and (RegexHelper.pager_prompt.search(last_line)
+                                  or RegexHelper.confirmation_prompt.search(last_line)):
+                resynced = self._resync()
+                raise MikrotikStallError(f"RouterOS is waiting on {last_line.strip()!r}. Resynchronized: {resynced}",
+                                         resynced)
+
             time.sleep(0.5)
             raw_read_result = self._serial_port.read(self._serial_port.in_waiting)
             read_attempt += 1
             if raw_read_result:
-                polished_read_result += ansi_escape.sub('', raw_read_result.decode())
+                polished_read_result += ansi_escape.sub('', raw_read_result.decode(errors='replace'))
 
             sys.stdout.write("\r\rRead Attempts: {0}".format(str(read_attempt)))
             sys.stdout.flush()
 
-        print("")
-        print(polished_read_result)
-        self._serial_port.flushInput()
-        print(f"=== END READ ===")
         return polished_read_result
 
+    def _resync(self) -> bool:
+        """
+        Try to get back to the terminal prompt by sending Ctrl-C followed by a blank line and probing for the prompt.
+
+        :return: True if the terminal prompt was found within resync_attempts attempts, False otherwise
+        """
+        for attempt in range(self.resync_attempts):
+            print(f"=== RESYNC ATTEMPT {attempt + 1} ===")
+            self._serial_port.write(b"\x03")
+            self._serial_port.write(b"\r\n")
+            self._serial_port.flush()
+            try:
+                self._read_until(on_terminal_prompt, time.monotonic() + 5, detect_stalls=False, detect_logout=False)
+            except MikrotikTimeoutError:
+                continue
+            self._serial_port.flushInput()
+            return True
+
+        return False
+
     def _write(self, command):
         print("=== BEGIN WRITE ===")
         print(command)
@@ -350,7 +731,14 @@ class MikrotikDevice:
         print("=== END WRITE ===")
         return ret
 
-    def connect(self, tty_path: str, baudrate: int, username: str, password: str):
+    def connect(self, tty_path: str, baudrate: int, username: str, password: str) -> bool:
+        """
+        Open the serial port and log in to RouterOS.
+
+        :raises MikrotikConnectionError: The serial port could not be opened
+        :raises MikrotikLoginError: Login failed
+        :return: True once logged in
+        """
         try:
             self._serial_port = Serial(tty_path,
                                        baudrate=baudrate,
@@ -359,16 +747,21 @@ class MikrotikDevice:
                                        bytesize=8,
                                        timeout=18,
                                        exclusive=True)
-        except SerialException or ValueError as e:
-            print(e)
-            return False
+        except (SerialException, ValueError) as e:
+            raise MikrotikConnectionError(f"Could not open {tty_path}: {e}") from e
 
-        self._login(username, password)
+        res = self._login(username, password)
+        if res is not True:
+            raise MikrotikLoginError(f"Login failed. Output: {res[-200:]!r}")
         return self._logged_in
 
     def disconnect(self):
         if self._logged_in:
-            self._logout()
+            try:
+                self._logout()
+            except MikrotikError as e:
+                # Still close the serial port below
+                print(e)
 
         if self._serial_port:
             if self._serial_port.is_open:
@@ -392,7 +785,8 @@ class MikrotikDevice:
             read_res = self.send_command(username, look_for='login')
 
             if "Password:" in read_res:
-                read_res = self.send_command(password)
+                # A rejected password returns to the login prompt
+                read_res = self.send_command(password, look_for='login')
 
         if on_terminal_prompt(read_res):
             # Already logged in or successfully logged in
@@ -7,6 +7,7 @@ import config_defaults
 from Shared import DHCPLease
 from Shared import DNSRecord
 from Shared import RegexHelper
+from RecordFilter import RecordFilter
 
 
 class PFSenseDevice:
@@ -14,39 +15,73 @@ class PFSenseDevice:
     Collection of methods for parsing Pfsense configuration
     """
 
-    # TODO: Make the ignored things configurable
+    _record_filter: RecordFilter = None
+
+    @staticmethod
+    def record_filter() -> RecordFilter:
+        """
+        :return: RecordFilter compiled from config_defaults.py. Compiled once, on first use.
+        """
+        if PFSenseDevice._record_filter is None:
+            PFSenseDevice._record_filter = RecordFilter.from_config()
+        return PFSenseDevice._record_filter
+
+    @staticmethod
+    def _iter_lines(file_path: str):
+        """
+        Lazily yield the lines of file_path without the trailing newline.
+        The file is read in buffered chunks, so memory use does not depend on the file size.
+        """
+        with open(file_path, 'r') as reader:
+            for line in reader:
+                yield line.rstrip("\n")
+
+    @staticmethod
+    def _unique(records) -> list:
+        """
+        :param records: Iterable of DNSRecord or DHCPLease dicts
+        :return: List of the unique records, in the order they were first seen
+        """
+        seen = set()
+        unique_records = []
+        for record in records:
+            key = tuple(record.values())
+            if key not in seen:
+                seen.add(key)
+                unique_records.append(record)
+        return unique_records
+
     @staticmethod
     def get_reserved_dns_records() -> list[DNSRecord]:
         """
-        Get reserved/preconfigured DNS records, excluding the record for pfsense itself and mk_sw3.lan
+        Get reserved/preconfigured DNS records, excluding records matched by the ignored_* config options
         :returns: List of Unique DNSRecord dicts
         """
-        static_dns_records = []
+        return PFSenseDevice._unique(PFSenseDevice.iter_reserved_dns_records())
+
+    @staticmethod
+    def iter_reserved_dns_records():
+        """
+        Generator version of get_reserved_dns_records. Records are yielded as they are parsed and are not deduplicated.
+        :returns: Iterator of DNSRecord dicts
+        """
+        record_filter = PFSenseDevice.record_filter()
         if config_defaults.host_entries_file:
             file_dir = config_defaults.host_entries_file
         else:
             file_dir = "/var/unbound/host_entries.conf"
 
-        with open(file_dir, 'r') as reader:
-            file = reader.read()
-            lines = iter(file.split("\n"))
-            for line in iter(lines):
-                static_dns_record: DNSRecord
-                line = line.replace("\"", "")
-                # TODO: Make this less horrible and more configurable
-                if line.startswith("local-data:"):  # Found alias
-                    if 'localhost' not in line \
-                            and 'pfsense.lan' not in line \
-                            and '10.0.0.1' not in line \
-                            and 'mk_sw3.lan' not in line:
-                        data = line.split(" ")
-                        static_dns_record = {'hostname': data[1][:-1].lower(),
-                                             'ip_address': data[3],
-                                             'record_type': data[2],
-                                             }
-                        if static_dns_record not in static_dns_records:
-                            static_dns_records.append(static_dns_record)
-        return static_dns_records
+        for line in PFSenseDevice._iter_lines(file_dir):
+            static_dns_record: DNSRecord
+            line = line.replace("\"", "")
+            if line.startswith("local-data:"):  # Found alias
+                data = line.split(" ")
+                static_dns_record = {'hostname': data[1][:-1].lower(),
+                                     'ip_address': data[3],
+                                     'record_type': data[2],
+                                     }
+                if not record_filter.excludes(static_dns_record):
+                    yield static_dns_record
 
     @staticmethod
     def get_dynamic_dhcp_leases() -> list[DHCPLease]:
@@ -54,54 +89,59 @@ class PFSenseDevice:
         Get the DHCP leases assigned from the DHCP pool. This does not include preconfigured / reserved leases.
         :return: List of Unique DHCPLease dict
         """
+        return PFSenseDevice._unique(PFSenseDevice.iter_dynamic_dhcp_leases())
+
+    @staticmethod
+    def iter_dynamic_dhcp_leases():
+        """
+        Generator version of get_dynamic_dhcp_leases. Leases are yielded as they are parsed and are not deduplicated.
+        :return: Iterator of DHCPLease dicts
+        """
         if config_defaults.dhcp_leases_file:
             file_path = config_defaults.dhcp_leases_file
         else:
             file_path = "/var/dhcpd/var/db/dhcpd.leases"
 
-        leases: list[DHCPLease] = []
         domain_name = PFSenseDevice.get_domain_name()
-
-        with open(file_path, 'r') as reader:
-            file = reader.read()
-            lines = iter(file.split("\n"))
-            for line in iter(lines):
-                if line.startswith("lease"):  # Found host
-                    ip_address = line.split(" ")[1]
-                    lease_start = datetime.now()
-                    lease_end = datetime.now()
-                    mac_address = ""
-                    hostname = ""
-
-                    while "}" not in line:
-                        # Check for MAC, IP, hostname, and lease time until the end of the host block.
-                        line = next(lines)
-
-                        # TODO: Add fallback / default values
-                        if "starts" in line:
-                            datetime_list = line.replace(';', '').split(" ")[4:]
-                            lease_start = datetime.strptime(f"{datetime_list[0]} {datetime_list[1]}",
-                                                            "%Y/%m/%d %H:%M:%S")
-                        if "ends" in line and "ends never" not in line:
-                            datetime_list = line.replace(';', '').split(" ")[4:]
-                            lease_end = datetime.strptime(f"{datetime_list[0]} {datetime_list[1]}",
-                                                          "%Y/%m/%d %H:%M:%S")
-                        if "hardware ethernet" in line:
-                            mac_address = line.replace(";", "").split(" ")[-1].upper()
-
-                        if "client-hostname" in line:
-                            hostname = line.replace(";", "").split(" ")[-1].replace("\"", "") + domain_name
-
-                    lease = DHCPLease(
-                        mac_address=mac_address,
-                        ip_address=ip_address,
-                        hostname=hostname,
-                        lease_duration=lease_end - lease_start
-                    )
-                    if lease not in leases:
-                        leases.append(lease)
-
-            return leases
+        record_filter = PFSenseDevice.record_filter()
+
+        lines = PFSenseDevice._iter_lines(file_path)
+        for line in lines:
+            if line.startswith("lease"):  # Found host
+                ip_address = line.split(" ")[1]
+                lease_start = datetime.now()
+                lease_end = datetime.now()
+                mac_address = ""
+                hostname = ""
+
+                while "}" not in line:
+                    # Check for MAC, IP, hostname, and lease time until the end of the host block.
+                    # A truncated file ends the host block.
+                    line = next(lines, "}")
+
+                    # TODO: Add fallback / default values
+                    if "starts" in line:
+                        datetime_list = line.replace(';', '').split(" ")[4:]
+                        lease_start = datetime.strptime(f"{datetime_list[0]} {datetime_list[1]}",
+                                                        "%Y/%m/%d %H:%M:%S")
+                    if "ends" in line and "ends never" not in line:
+                        datetime_list = line.replace(';', '').split(" ")[4:]
+                        lease_end = datetime.strptime(f"{datetime_list[0]} {datetime_list[1]}",
+                                                      "%Y/%m/%d %H:%M:%S")
+                    if "hardware ethernet" in line:
+                        mac_address = line.replace(";", "").split(" ")[-1].upper()
+
+                    if "client-hostname" in line:
+                        hostname = line.replace(";", "").split(" ")[-1].replace("\"", "") + domain_name
+
+                lease = DHCPLease(
+                    mac_address=mac_address,
+                    ip_address=ip_address,
+                    hostname=hostname,
+                    lease_duration=lease_end - lease_start
+                )
+                if not record_filter.excludes(lease):
+                    yield lease
 
     @staticmethod
     def get_reserved_dhcp_leases() -> list[DHCPLease]:
@@ -110,53 +150,59 @@ class PFSenseDevice:
         is reserved by the reserved DHCP record.
         :return: List of Unique DHCPLease dicts
         """
+        return PFSenseDevice._unique(PFSenseDevice.iter_reserved_dhcp_leases())
+
+    @staticmethod
+    def iter_reserved_dhcp_leases():
+        """
+        Generator version of get_reserved_dhcp_leases. Leases are yielded as they are parsed and are not deduplicated.
+        :return: Iterator of DHCPLease dicts
+        """
         # /var/dhcpd/etc/dhcpd.conf
         if config_defaults.dhcpd_conf_file:
             file_path = config_defaults.dhcpd_conf_file
         else:
             file_path = "/var/dhcpd/etc/dhcpd.conf"
-        leases: list[DHCPLease] = []
-        with open(file_path, 'r') as reader:
-            file = reader.read()
-            lines = iter(file.split("\n"))
-            subclass_prefix = ''
-            domain_name = ''
-            default_lease_seconds = 7200
-
-            for line in lines:
-                if line.startswith("option domain-name") and domain_name == '':
-                    domain_name = f".{RegexHelper.quoted_text.search(line).group(1)}"
-                if line.startswith("class"):
-                    subclass_prefix = RegexHelper.quoted_text.search(line).group(1)
-                if line.startswith("default-lease-time"):
-                    default_lease_seconds = int(line.replace(";", "").split(" ")[-1])
-                if subclass_prefix != '':
-                    if line.startswith(f'host {subclass_prefix}_'):
-                        mac_address, ip_address, hostname = "", "", ""
-                        # Host record found
-                        while line != '}':
-                            line = next(lines)
-                            if "hardware ethernet" in line:
-                                mac_address = line.replace(";", "").split(" ")[-1].upper()
-                                continue
-                            if "fixed-address" in line:
-                                ip_address = line.replace(";", "").split(" ")[-1]
-                                continue
-                            if "option host-name" in line:
-                                assert domain_name != ''
-                                hostname = line.replace(";", "").split(" ")[-1].replace("\"", "") + domain_name
-                                continue
-
-                        lease = DHCPLease(
-                            mac_address=mac_address,
-                            ip_address=ip_address,
-                            hostname=hostname,
-                            lease_duration=timedelta(seconds=default_lease_seconds)
-                        )
-                        if lease not in leases:
-                            leases.append(lease)
-
-        return leases
+
+        record_filter = PFSenseDevice.record_filter()
+        lines = PFSenseDevice._iter_lines(file_path)
+        subclass_prefix = ''
+        domain_name = ''
+        default_lease_seconds = 7200
+
+        for line in lines:
+            if line.startswith("option domain-name") and domain_name == '':
+                domain_name = f".{RegexHelper.quoted_text.search(line).group(1)}"
+            if line.startswith("class"):
+                subclass_prefix = RegexHelper.quoted_text.search(line).group(1)
+            if line.startswith("default-lease-time"):
+                default_lease_seconds = int(line.replace(";", "").split(" ")[-1])
+            if subclass_prefix != '':
+                if line.startswith(f'host {subclass_prefix}_'):
+                    mac_address, ip_address, hostname = "", "", ""
+                    # Host record found
+                    while line != '}':
+                        # A truncated file ends the host block.
+                        line = next(lines, '}')
+                        if "hardware ethernet" in line:
+                            mac_address = line.replace(";", "").split(" ")[-1].upper()
+                            continue
+                        if "fixed-address" in line:
+                            ip_address = line.replace(";", "").split(" ")[-1]
+                            continue
+                        if "option host-name" in line:
+                            assert domain_name != ''
+                            hostname = line.replace(";", "").split(" ")[-1].replace("\"", "") + domain_name
+                            continue
+
+                    lease = DHCPLease(
+                        mac_address=mac_address,
+                        ip_address=ip_address,
+                        hostname=hostname,
+                        lease_duration=timedelta(seconds=default_lease_seconds)
+                    )
+                    if not record_filter.excludes(lease):
+                        yield lease
 
     @staticmethod
     def get_domain_name():
@@ -165,9 +211,6 @@ class PFSenseDevice:
         else:
             file_path = "/var/dhcpd/etc/dhcpd.conf"
 
-        with open(file_path, 'r') as reader:
-            file = reader.read()
-            lines = iter(file.split("\n"))
-            for line in lines:
-                if line.startswith("option domain-name"):
-                    return "." + RegexHelper.quoted_text.search(line).group(1)
+        for line in PFSenseDevice._iter_lines(file_path):
+            if line.startswith("option domain-name"):
+                return "." + RegexHelper.quoted_text.search(line).group(1)
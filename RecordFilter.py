@@ -0,0 +1,116 @@
+from __future__ import annotations  # for Python 3.7-3.9
+from bisect import bisect_right
+from fnmatch import translate
+
+import ipaddress
+import re
+
+import config_defaults
+
+
+class RecordFilter:
+    """
+    Compiled exclusion rules for DNS records and DHCP leases.
+
+    | Hostname patterns without wildcards are suffixes on a label boundary. 'pfsense.lan' excludes 'pfsense.lan'
+    | and 'foo.pfsense.lan' but not 'notpfsense.lan'. Patterns with wildcards (*, ?, [...]) are globs matched
+    | against the whole hostname.
+    | IP addresses can be single addresses or CIDR ranges. IPv4 and IPv6 are both supported.
+    | MAC prefixes may use any or no separators. 'a4:bb:6d' excludes 'A4:BB:6D:23:E1:85'
+    | Record types are matched against the record_type of DNS records. I.E, 'AAAA'
+    """
+
+    _end_of_suffix = ""
+    """ Trie key marking that a complete suffix ends at this node. Never a valid label. """
+
+    def __init__(self, hostnames=(), ip_addresses=(), mac_prefixes=(), record_types=()):
+        # Suffix trie of reversed hostname labels. {'lan': {'pfsense': {'': True}}}
+        self._hostname_suffixes: dict = {}
+        hostname_globs = []
+        for pattern in hostnames:
+            pattern = pattern.lower().strip(".")
+            if any(character in pattern for character in "*?["):
+                hostname_globs.append(translate(pattern))
+            else:
+                node = self._hostname_suffixes
+                for label in reversed(pattern.split(".")):
+                    node = node.setdefault(label, {})
+                node[self._end_of_suffix] = True
+        self._hostname_glob = re.compile("|".join(hostname_globs)) if hostname_globs else None
+
+        # Merged, sorted intervals of integer addresses per IP version. Searched with bisect.
+        self._ip_interval_starts: dict[int, list[int]] = {4: [], 6: []}
+        self._ip_interval_ends: dict[int, list[int]] = {4: [], 6: []}
+        intervals: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        for address in ip_addresses:
+            network = ipaddress.ip_network(address, strict=False)
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        for version, version_intervals in intervals.items():
+            for start, end in sorted(version_intervals):
+                if self._ip_interval_ends[version] and start <= self._ip_interval_ends[version][-1] + 1:
+                    self._ip_interval_ends[version][-1] = max(self._ip_interval_ends[version][-1], end)
+                else:
+                    self._ip_interval_starts[version].append(start)
+                    self._ip_interval_ends[version].append(end)
+
+        self._mac_prefixes = tuple(self._normalize_mac(prefix) for prefix in mac_prefixes)
+        self._record_types = frozenset(record_type.upper() for record_type in record_types)
+
+    @staticmethod
+    def from_config() -> RecordFilter:
+        """
+        :return: RecordFilter compiled from the ignored_* options in config_defaults.py
+        """
+        return RecordFilter(hostnames=config_defaults.ignored_hostnames,
+                            ip_addresses=config_defaults.ignored_ip_addresses,
+                            mac_prefixes=config_defaults.ignored_mac_prefixes,
+                            record_types=config_defaults.ignored_record_types)
+
+    @staticmethod
+    def _normalize_mac(mac_address: str) -> str:
+        return mac_address.upper().replace(":", "").replace("-", "").replace(".", "")
+
+    def matches_hostname(self, hostname: str) -> bool:
+        if not hostname:
+            return False
+        hostname = hostname.lower().strip(".")
+
+        node = self._hostname_suffixes
+        for label in reversed(hostname.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            if self._end_of_suffix in node:
+                return True
+
+        return self._hostname_glob is not None and self._hostname_glob.match(hostname) is not None
+
+    def matches_ip_address(self, ip_address: str) -> bool:
+        if not ip_address:
+            return False
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return False
+
+        value = int(address)
+        index = bisect_right(self._ip_interval_starts[address.version], value) - 1
+        return index >= 0 and value <= self._ip_interval_ends[address.version][index]
+
+    def matches_mac_address(self, mac_address: str) -> bool:
+        if not mac_address or not self._mac_prefixes:
+            return False
+        return self._normalize_mac(mac_address).startswith(self._mac_prefixes)
+
+    def matches_record_type(self, record_type: str) -> bool:
+        return bool(record_type) and record_type.upper() in self._record_types
+
+    def excludes(self, record: dict) -> bool:
+        """
+        :param record: DNSRecord or DHCPLease dict
+        :return: True if any field of record matches an exclusion rule
+        """
+        return self.matches_hostname(record.get('hostname')) \
+            or self.matches_ip_address(record.get('ip_address')) \
+            or self.matches_mac_address(record.get('mac_address')) \
+            or self.matches_record_type(record.get('record_type'))
@@ -1,7 +1,11 @@
 from __future__ import annotations  # for Python 3.7-3.9
-from typing_extensions import TypedDict
+try:
+    from typing import TypedDict  # Python 3.8+. Avoids importing typing_extensions on the link_up fast path
+except ImportError:
+    from typing_extensions import TypedDict  # for Python 3.7
 from datetime import timedelta
 
+import hashlib
 import re
 
 
@@ -12,6 +16,18 @@ class RegexHelper:
     # Matches text in the format of [something@somethingelse]
     terminal_prompt = re.compile('\[[^]]+@[^]]+]')
 
+    # Matches the RouterOS pager prompt. I.E, '-- [Q quit|D dump|down]'
+    pager_prompt = re.compile(r'-- \[Q quit\|')
+
+    # Matches RouterOS confirmation prompts. I.E, '[y/N]:'
+    confirmation_prompt = re.compile(r'\[[yY]/[nN]]:?\s*$')
+
+    # Matches the output of the file size query in MikrotikDevice._write_file. I.E, 'file-size|1234'
+    file_size = re.compile(r'file-size\|(\d+)')
+
+    # Matches the number and unit parts of a RouterOS time value. I.E, '1d2h' -> ('1', 'd'), ('2', 'h')
+    duration_parts = re.compile(r'(\d+)([wdhms])')
+
     get_key_equal_value_groups = re.compile('([\w-]+)=(".+?"|\S+)(?= [\w-]+=|\s*\Z)')
     """ Returns two groups. Group 1 is the key and Group 2 is the value of the key """
 
@@ -49,3 +65,59 @@ class DHCPLease(TypedDict):
     ip_address: str
     hostname: str
     lease_duration: timedelta
+
+
+class FingerprintHelper:
+    """
+    Builds canonical keys and fingerprints for records so that pfSense and RouterOS state can be compared without
+    transferring or parsing full exports. Only the fields written to RouterOS by mikrotikSync are part of a key.
+    """
+
+    # Matches a record line emitted by the RouterOS fingerprint scripts. Group 1 is the canonical record key.
+    fingerprint_line = re.compile(r'^fp\|(.*)$')
+
+    # Matches the record count emitted by the RouterOS fingerprint scripts. Group 1 is the count.
+    fingerprint_count = re.compile(r'^fp-count\|(\d+)$')
+
+    # Matches a content hash tag in a RouterOS comment. Group 1 is the hash.
+    hash_tag = re.compile(r'hash:([0-9a-f]{10})')
+
+    # Matches a record line emitted by the RouterOS hash listing scripts. Group 1 is the .id and Group 2 the comment.
+    id_comment_line = re.compile(r'^id\|(\*[0-9A-Fa-f]+)\|(.*)$')
+
+    @staticmethod
+    def dns_record_key(record: DNSRecord) -> str:
+        """
+        :return: Canonical key for a DNS record in the form hostname|ip_address|record_type
+        """
+        record_type = record['record_type'] if record['record_type'] else "A"
+        return f"{record['hostname'].lower()}|{record['ip_address']}|{record_type.upper()}"
+
+    @staticmethod
+    def dhcp_lease_key(lease: DHCPLease) -> str:
+        """
+        :return: Canonical key for a DHCP lease in the form mac_address|ip_address|lease_seconds
+        """
+        # RouterOS uses an IP of 0.0.0.0 to indicate dynamic assignment
+        ip_address = lease['ip_address'] if lease['ip_address'] else "0.0.0.0"
+        return f"{lease['mac_address'].upper()}|{ip_address}|{int(lease['lease_duration'].total_seconds())}"
+
+    @staticmethod
+    def record_hash(key: str) -> str:
+        """
+        :param key: Canonical record key
+        :return: Short, stable hash of the canonical record key. Used to tag records in RouterOS comments.
+        """
+        return hashlib.sha1(key.encode()).hexdigest()[:10]
+
+    @staticmethod
+    def fingerprint(keys) -> str:
+        """
+        Order independent fingerprint of a collection of canonical record keys. Duplicate keys are ignored.
+
+        :param keys: Iterable of canonical record keys
+        :return: String in the form 'count:sha1'
+        """
+        unique_keys = sorted(set(keys))
+        digest = hashlib.sha1("\n".join(unique_keys).encode()).hexdigest()
+        return f"{len(unique_keys)}:{digest}"
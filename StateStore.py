@@ -0,0 +1,188 @@
+from __future__ import annotations  # for Python 3.7-3.9
+from datetime import datetime
+from datetime import timedelta
+
+import sqlite3
+
+from Shared import DHCPLease
+from Shared import DNSRecord
+from Shared import FingerprintHelper
+
+
+class RouterStateStore:
+    """
+    Local SQLite mirror of the records mikrotikSync last wrote to each RouterOS device.
+
+    | Records are keyed by device, kind ('dns' or 'lease') and content hash (See FingerprintHelper.record_hash).
+    | RouterOS .ids are not kept since they change when a record is removed and re-added by hand. Records are removed
+    | by hash tag instead. The record fields are NULL for records found on RouterOS during a reconciliation that
+    | mikrotikSync does not know the content of. Those records are always removed by the next sync.
+    | Records are indexed by MAC address, IP address and hostname for the find_by_* lookups.
+    """
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS records (
+            device TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            record_hash TEXT NOT NULL,
+            mac_address TEXT,
+            ip_address TEXT,
+            hostname TEXT,
+            record_type TEXT,
+            lease_seconds INTEGER,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (device, kind, record_hash)
+        );
+        CREATE INDEX IF NOT EXISTS records_mac_address ON records (device, mac_address);
+        CREATE INDEX IF NOT EXISTS records_ip_address ON records (device, ip_address);
+        CREATE INDEX IF NOT EXISTS records_hostname ON records (device, hostname);
+        CREATE TABLE IF NOT EXISTS reconciliations (
+            device TEXT PRIMARY KEY,
+            reconciled_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str, device: str):
+        """
+        :param db_path: Path to the SQLite database. Created if it does not exist.
+        :param device: Identifies the RouterOS device. I.E, the serial port it is connected to.
+        """
+        self.device = device
+        self._connection = sqlite3.connect(db_path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(self._schema)
+
+    def close(self):
+        self._connection.close()
+
+    def hashes(self, kind: str) -> set[str]:
+        """
+        :param kind: 'dns' or 'lease'
+        :return: Content hashes of the stored records
+        """
+        rows = self._connection.execute("SELECT record_hash FROM records WHERE device = ? AND kind = ?",
+                                        (self.device, kind))
+        return {row['record_hash'] for row in rows}
+
+    def fingerprint(self, kind: str) -> str | None:
+        """
+        :param kind: 'dns' or 'lease'
+        :return: Fingerprint of the stored records (See FingerprintHelper.fingerprint), or None if the content of any
+        stored record is unknown
+        """
+        keys = []
+        for row in self._connection.execute("SELECT * FROM records WHERE device = ? AND kind = ?", (self.device, kind)):
+            if row['ip_address'] is None:
+                return None
+            if kind == 'dns':
+                keys.append(FingerprintHelper.dns_record_key(DNSRecord(hostname=row['hostname'],
+                                                                       ip_address=row['ip_address'],
+                                                                       record_type=row['record_type'])))
+            else:
+                keys.append(FingerprintHelper.dhcp_lease_key(DHCPLease(
+                    mac_address=row['mac_address'],
+                    ip_address=row['ip_address'],
+                    hostname=row['hostname'],
+                    lease_duration=timedelta(seconds=row['lease_seconds']))))
+        return FingerprintHelper.fingerprint(keys)
+
+    _upsert = """
+        INSERT INTO records (device, kind, record_hash, mac_address, ip_address, hostname, record_type, lease_seconds,
+                             updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (device, kind, record_hash) DO UPDATE SET
+            mac_address = COALESCE(excluded.mac_address, mac_address),
+            ip_address = COALESCE(excluded.ip_address, ip_address),
+            hostname = COALESCE(excluded.hostname, hostname),
+            record_type = COALESCE(excluded.record_type, record_type),
+            lease_seconds = COALESCE(excluded.lease_seconds, lease_seconds),
+            updated_at = excluded.updated_at
+    """
+
+    def _upsert_rows(self, kind: str, records) -> list[tuple]:
+        """
+        :param records: Iterable of (content hash, record or None)
+        :return: Parameters for _upsert
+        """
+        updated_at = datetime.now().isoformat()
+        rows = []
+        for record_hash, record in records:
+            record = record if record else {}
+            lease_duration = record.get('lease_duration')
+            rows.append((self.device, kind, record_hash, record.get('mac_address'),
+                         record.get('ip_address'), record.get('hostname'), record.get('record_type'),
+                         int(lease_duration.total_seconds()) if lease_duration is not None else None, updated_at))
+        return rows
+
+    def put(self, kind: str, record_hash: str, record: dict = None):
+        """
+        Insert or update a record. Fields that are not given keep their stored value.
+        Use put_many when storing more than one record, since every call is a separate transaction.
+
+        :param kind: 'dns' or 'lease'
+        :param record_hash: Content hash of the record
+        :param record: DNSRecord or DHCPLease dict, or None if the content is not known
+        """
+        self.put_many(kind, [(record_hash, record)])
+
+    def put_many(self, kind: str, records):
+        """
+        Insert or update records in a single transaction. See put
+
+        :param kind: 'dns' or 'lease'
+        :param records: Iterable of (content hash, record or None)
+        """
+        with self._connection:
+            self._connection.executemany(self._upsert, self._upsert_rows(kind, records))
+
+    def remove(self, kind: str, record_hashes):
+        with self._connection:
+            self._connection.executemany("DELETE FROM records WHERE device = ? AND kind = ? AND record_hash = ?",
+                                         [(self.device, kind, record_hash) for record_hash in record_hashes])
+
+    def replace(self, kind: str, present, known_records: dict[str, dict]):
+        """
+        Replace all stored records of kind with the records found on RouterOS, in a single transaction.
+
+        :param kind: 'dns' or 'lease'
+        :param present: Iterable of the content hashes read from RouterOS
+        :param known_records: Dict of content hash -> record for hashes whose content is known
+        """
+        # Untagged records ('' hash) are not tracked. They are removed by .id during the sync.
+        rows = self._upsert_rows(kind, [(record_hash, known_records.get(record_hash))
+                                        for record_hash in present if record_hash])
+        with self._connection:
+            self._connection.execute("DELETE FROM records WHERE device = ? AND kind = ?", (self.device, kind))
+            self._connection.executemany(self._upsert, rows)
+
+    def find_by_mac_address(self, mac_address: str) -> list[sqlite3.Row]:
+        return self._connection.execute("SELECT * FROM records WHERE device = ? AND mac_address = ?",
+                                        (self.device, mac_address.upper())).fetchall()
+
+    def find_by_ip_address(self, ip_address: str) -> list[sqlite3.Row]:
+        return self._connection.execute("SELECT * FROM records WHERE device = ? AND ip_address = ?",
+                                        (self.device, ip_address)).fetchall()
+
+    def find_by_hostname(self, hostname: str) -> list[sqlite3.Row]:
+        return self._connection.execute("SELECT * FROM records WHERE device = ? AND hostname = ?",
+                                        (self.device, hostname)).fetchall()
+
+    def last_reconciled(self) -> datetime | None:
+        """
+        :return: When the store was last refreshed from a full read of RouterOS state, or None if never
+        """
+        row = self._connection.execute("SELECT reconciled_at FROM reconciliations WHERE device = ?",
+                                       (self.device,)).fetchone()
+        return datetime.fromisoformat(row['reconciled_at']) if row else None
+
+    def mark_reconciled(self):
+        self._connection.execute("INSERT OR REPLACE INTO reconciliations (device, reconciled_at) VALUES (?, ?)",
+                                 (self.device, datetime.now().isoformat()))
+        self._connection.commit()
+
+    def invalidate(self):
+        """
+        Force a full reconciliation on the next sync
+        """
+        self._connection.execute("DELETE FROM reconciliations WHERE device = ?", (self.device,))
+        self._connection.commit()
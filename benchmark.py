@@ -0,0 +1,147 @@
+"""
+| Parser micro-benchmarks on synthetic data (See synthetic_data.py).
+|
+| Usage: benchmark.py [--sizes 100,1000,10000] [--rounds 5] [--save results.json] [--compare baseline.json]
+|
+| Each parser is run --rounds times per dataset size. The min/median/max wall time and the peak traced memory
+| are reported. --save writes the results as JSON and --compare flags any parser whose median time or peak
+| memory regressed by more than --threshold percent against a previously saved run.
+"""
+from __future__ import annotations  # for Python 3.7-3.9
+from statistics import median
+from tempfile import TemporaryDirectory
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import config_defaults
+import synthetic_data
+from Mikrotik import MikrotikDevice
+from PFSense import PFSenseDevice
+from RecordFilter import RecordFilter
+from Shared import RegexHelper
+
+
+def _read(path: str) -> str:
+    with open(path, 'r', newline='') as reader:
+        return reader.read()
+
+
+def _parsers(dataset: dict[str, str]) -> dict[str, callable]:
+    """
+    :param dataset: Dict of dataset name -> file path (See synthetic_data.write_dataset)
+    :return: Dict of benchmark name -> zero argument callable
+    """
+    config_defaults.dhcpd_conf_file = dataset["dhcpd_conf"]
+    config_defaults.dhcp_leases_file = dataset["dhcpd_leases"]
+    config_defaults.host_entries_file = dataset["host_entries"]
+
+    dns_export = _read(dataset["dns_static_export"])
+    lease_export = _read(dataset["dhcp_lease_export"])
+    kv_rows = [line[len("/ip dhcp-server lease add "):] for line in lease_export.split("\r\n")
+               if line.startswith("/ip dhcp-server lease add ")]
+
+    # A few hundred rules of every kind, none of which match the synthetic hosts
+    record_filter = RecordFilter(hostnames=[f"excluded{index}.lan" for index in range(200)] + ["*.excluded.*"],
+                                 ip_addresses=[f"172.16.{index}.0/24" for index in range(200)],
+                                 mac_prefixes=[f"0A:{index // 256:02X}:{index % 256:02X}" for index in range(200)],
+                                 record_types=["AAAA", "CNAME"])
+    filter_records = PFSenseDevice.get_reserved_dns_records() + PFSenseDevice.get_reserved_dhcp_leases()
+
+    return {
+        "filter.excludes": lambda: [record_filter.excludes(record) for record in filter_records],
+        "pfsense.get_reserved_dns_records": PFSenseDevice.get_reserved_dns_records,
+        "pfsense.get_reserved_dhcp_leases": PFSenseDevice.get_reserved_dhcp_leases,
+        "pfsense.get_dynamic_dhcp_leases": PFSenseDevice.get_dynamic_dhcp_leases,
+        # Consumed without keeping the records, so peak memory should not grow with the dataset size
+        "pfsense.iter_dynamic_dhcp_leases": lambda: sum(1 for _ in PFSenseDevice.iter_dynamic_dhcp_leases()),
+        "routeros.parse_static_dns_export": lambda: MikrotikDevice.parse_static_dns_export(dns_export),
+        "routeros.parse_reserved_dhcp_export": lambda: MikrotikDevice.parse_reserved_dhcp_export(lease_export),
+        "shared.convert_kv_string_to_dict": lambda: [RegexHelper.convert_kv_string_to_dict(row) for row in kv_rows],
+    }
+
+
+def _measure(parser: callable, rounds: int) -> dict[str, float]:
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parser()
+        times.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate run since tracemalloc slows down the parser considerably
+    tracemalloc.start()
+    parser()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"min": min(times), "median": median(times), "max": max(times), "peak_bytes": peak}
+
+
+def run(sizes: list[int], rounds: int) -> dict[str, dict[str, dict[str, float]]]:
+    """
+    :return: Dict of size -> benchmark name -> measurements
+    """
+    results = {}
+    with TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            dataset = synthetic_data.write_dataset(f"{tmp_dir}/{size}", size)
+            results[str(size)] = {name: _measure(parser, rounds) for name, parser in _parsers(dataset).items()}
+    return results
+
+
+def print_results(results: dict, baseline: dict = None, threshold: float = 10.0) -> bool:
+    """
+    Pretty print benchmark results, optionally compared against a baseline.
+
+    :return: True if any benchmark regressed by more than threshold percent
+    """
+    regressed = False
+    print(f"{'benchmark':<40} {'size':>7} {'min ms':>10} {'median ms':>10} {'max ms':>10} {'peak KiB':>10}")
+    for size, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            line = f"{name:<40} {size:>7} {result['min'] * 1000:>10.2f} {result['median'] * 1000:>10.2f} " \
+                   f"{result['max'] * 1000:>10.2f} {result['peak_bytes'] / 1024:>10.1f}"
+
+            try:
+                base = baseline[size][name]
+            except (KeyError, TypeError):
+                print(line)
+                continue
+
+            time_change = (result['median'] / base['median'] - 1) * 100 if base['median'] else 0
+            memory_change = (result['peak_bytes'] / base['peak_bytes'] - 1) * 100 if base['peak_bytes'] else 0
+            line += f" {time_change:>+7.1f}% {memory_change:>+7.1f}%"
+            if time_change > threshold or memory_change > threshold:
+                line += " REGRESSION"
+                regressed = True
+            print(line)
+
+    return regressed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parser micro-benchmarks on synthetic data")
+    arg_parser.add_argument("--sizes", default="100,1000,10000", help="Comma separated dataset sizes")
+    arg_parser.add_argument("--rounds", type=int, default=5, help="Timed runs per parser and size")
+    arg_parser.add_argument("--save", help="Write results to this JSON file")
+    arg_parser.add_argument("--compare", help="Compare results against this JSON file")
+    arg_parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = arg_parser.parse_args()
+
+    benchmark_results = run([int(size) for size in args.sizes.split(",")], args.rounds)
+
+    baseline_results = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline_results = json.load(baseline_file)
+
+    any_regressed = print_results(benchmark_results, baseline_results, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(benchmark_results, results_file, indent=2)
+
+    sys.exit(1 if any_regressed else 0)
@@ -24,6 +24,55 @@ host_entries_file: str = '/var/unbound/host_entries.conf'
 | Default: /var/unbound/host_entries.conf
 """
 
+ignored_hostnames: list = ["localhost", "localhost.*", "pfsense.lan", "mk_sw3.lan"]
+"""
+| pfSense records with a matching hostname are not synced.
+| Entries without wildcards match the hostname and any subdomain of it. I.E, 'pfsense.lan' matches 'a.pfsense.lan'
+| Entries with wildcards (*, ?, [...]) are globs matched against the whole hostname.
+| Default: ["localhost", "localhost.*", "pfsense.lan", "mk_sw3.lan"]
+"""
+
+ignored_ip_addresses: list = ["10.0.0.1", "127.0.0.0/8", "::1"]
+"""
+| pfSense records with a matching IP address are not synced. Single addresses and CIDR ranges are supported.
+| Addresses match exactly. Older versions excluded any DNS record containing the text '10.0.0.1', which also hid
+| 10.0.0.10-19 and 10.0.0.100-199. Those are synced now. To keep excluding them, add
+| "10.0.0.10/31", "10.0.0.12/30", "10.0.0.16/30", "10.0.0.100/30", "10.0.0.104/29", "10.0.0.112/28",
+| "10.0.0.128/26", "10.0.0.192/29"
+| Default: ["10.0.0.1", "127.0.0.0/8", "::1"]
+"""
+
+ignored_mac_prefixes: list = []
+"""
+| pfSense DHCP leases with a MAC address starting with any of these prefixes are not synced. I.E, "A4:BB:6D"
+| Default: []
+"""
+
+ignored_record_types: list = []
+"""
+| pfSense DNS records with a matching record type are not synced. I.E, "AAAA"
+| Default: []
+"""
+
+state_db_file: str = 'router_state.sqlite3'
+"""
+| SQLite database mirroring the records last written to RouterOS. Used by --sync and --plan to work out changes
+| without reading RouterOS state over the serial link.
+| Default: router_state.sqlite3
+"""
+
+full_reconcile_interval_hours: float = 24
+"""
+| How often --sync refreshes the local state database from RouterOS even when the fingerprints say it is current.
+| Default: 24
+"""
+
+plan_file: str = 'sync_plan.rsc'
+"""
+| RouterOS script written by --plan and transferred to RouterOS by --apply
+| Default: sync_plan.rsc
+"""
+
 serial_port: str = "/dev/ttyU0"
 """
 Default: /dev/ttyU0
@@ -34,6 +83,25 @@ baud_rate: int = 115200
 Default: 115200
 """
 
+command_timeout_seconds: float = 30
+"""
+| How long to wait for the RouterOS prompt after a command before giving up and resynchronizing the console.
+| Default: 30
+"""
+
+export_timeout_seconds: float = 300
+"""
+| How long to wait for the RouterOS prompt after commands that transfer whole tables, like export and import.
+| Default: 300
+"""
+
+resync_attempts: int = 3
+"""
+| How many times to send Ctrl-C and a blank line to get back to the RouterOS prompt after a timeout or a stall
+| (pager, confirmation prompt).
+| Default: 3
+"""
+
 login_interval_seconds: int = 10
 """
 | How long it has been since the script last logged in to the backup router.
@@ -41,4 +109,12 @@ login_interval_seconds: int = 10
 |
 | This is to prevent possible endless loops of the backup router beinging up/down a port while reconfiguring, which then
 | triggers the devd to run this script again, etc
-"""
\ No newline at end of file
+"""
+
+fingerprint_verification: bool = True
+"""
+| Compare a fingerprint of the pfsense records on RouterOS against the local pfSense records instead of
+| re-exporting both RouterOS tables after a sync. Matching fingerprints before a sync skip the sync entirely.
+| A mismatch falls back to a full sync and a full export.
+| Default: True
+"""
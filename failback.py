@@ -0,0 +1,226 @@
+"""
+| Fast-start entry point for --link_up. Sets the backup RouterOS device back to standby once pfSense is up.
+|
+| Usage: failback.py
+|
+| Runs at boot and on devd LINK_UP events, when the firewall is busiest. Only time, threading and Errors.py are imported
+| up front. Everything else is imported when first needed, and the serial port is opened and logged in to on a
+| background thread while the LAN reachability checks run. Per-stage timings and the time to standby are printed
+| on exit.
+"""
+import time
+
+_process_start = time.perf_counter()
+
+import threading
+
+from Errors import SyncError
+from Errors import run
+
+LAN_HOSTS = ("10.0.0.2", "10.0.0.3", "10.0.0.20")
+""" At least one of these must respond to a ping before the backup router is set to standby """
+
+
+class StageTimer:
+    """
+    Records how long each startup stage took. Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, started: float):
+        """
+        Record the time since started (time.perf_counter) as the duration of stage name
+        """
+        with self._lock:
+            self.stages[name] = time.perf_counter() - started
+
+    def print(self):
+        for name, seconds in list(self.stages.items()):
+            print(f"{name:<28} {seconds * 1000:>10.1f} ms")
+
+
+# Credit to https://stackoverflow.com/questions/2953462/pinging-servers-in-python
+def ping(host):
+    """
+    Returns True if host (str) responds to a ping request.
+    Remember that a host may not respond to a ping (ICMP) request even if the host name is valid.
+    """
+    import platform  # For getting the operating system name
+    import subprocess  # For executing a shell command
+
+    # Option for the number of packets as a function of
+    param = '-n' if platform.system().lower() == 'windows' else '-c'
+
+    # Building the command. Ex: "ping -c 1 google.com"
+    command = ['ping', param, '1', host]
+
+    return subprocess.call(command) == 0
+
+
+def set_backup_router_to_standby(backup_router):
+    """
+    Set the configuration of the backup Mikrotik device back to the 'standby' / 'switch' configuration.
+    :param backup_router: Connected and logged in MikrotikDevice
+    :return: True if successful, False otherwise
+    """
+    in_standby_config = False
+    backup_router.send_command(":global mode switch")
+    res = backup_router.send_command(":put $mode")
+
+    if 'switch' in res.splitlines():
+        res = backup_router.send_command("/system/script/run setMode")
+        if "Setting configuration to switch mode!" in res and "Done configuring!" in res:
+            res = backup_router.send_command(":put [/interface/ethernet/get ether8 mac-address]")
+            if "18:FD:74:78:5D:DB" in res:
+                in_standby_config = True
+
+    return in_standby_config
+
+
+def login_interval_throttled():
+    from datetime import datetime
+    from datetime import timedelta
+    from os.path import isfile
+
+    import config_defaults
+
+    if not isfile('last_login.txt'):
+        print("Info: last_login.txt does not exist.")
+        return False
+
+    with open('last_login.txt', 'r') as file:
+        content = file.read()
+        if not content or content == "" or content == "''":
+            print("Info: Ignoring empty last_login.txt")
+            return False
+
+        last_login = datetime.strptime(content, "%m/%d/%Y, %H:%M:%S")
+        if (datetime.now() - last_login) < timedelta(seconds=config_defaults.login_interval_seconds):
+            return True
+
+
+def record_login():
+    """
+    Write the current time to last_login.txt. See login_interval_throttled
+    """
+    from datetime import datetime
+
+    with open('last_login.txt', 'w') as _file:
+        _file.write(datetime.now().strftime("%m/%d/%Y, %H:%M:%S"))
+
+
+def connect_backup_router(timer: StageTimer):
+    """
+    Import Mikrotik.py, open the serial port and log in to RouterOS
+
+    :return: Connected and logged in MikrotikDevice
+    """
+    started = time.perf_counter()
+    from Mikrotik import MikrotikDevice
+    import config_defaults
+    import secrets
+    timer.stage("import Mikrotik", started)
+
+    mikro_device = MikrotikDevice(command_timeout_seconds=config_defaults.command_timeout_seconds,
+                                  export_timeout_seconds=config_defaults.export_timeout_seconds,
+                                  resync_attempts=config_defaults.resync_attempts)
+    started = time.perf_counter()
+    try:
+        mikro_device.connect(config_defaults.serial_port if config_defaults.serial_port else "/dev/ttyU0",
+                             config_defaults.baud_rate if config_defaults.baud_rate else 115200,
+                             secrets.routeros_username, secrets.routeros_password)
+    except BaseException:
+        mikro_device.disconnect()
+        raise
+    timer.stage("connect and login", started)
+    return mikro_device
+
+
+class _BackgroundConnect(threading.Thread):
+    """
+    Runs connect_backup_router on a separate thread. Errors are re-raised by result()
+    """
+
+    def __init__(self, timer: StageTimer):
+        super().__init__(name="connect_backup_router", daemon=True)
+        self._timer = timer
+        self._device = None
+        self._error = None
+
+    def run(self):
+        try:
+            self._device = connect_backup_router(self._timer)
+        except BaseException as e:
+            self._error = e
+
+    def result(self):
+        """
+        Wait for the connection attempt to finish
+        :return: Connected and logged in MikrotikDevice
+        """
+        self.join()
+        if self._error is not None:
+            raise self._error
+        return self._device
+
+
+def main(timer: StageTimer = None):
+    timer = timer if timer else StageTimer()
+
+    started = time.perf_counter()
+    import config_defaults
+    import config  # Pycharm says this is unused, but it is actually needed for overriding defaults
+    timer.stage("import config", started)
+
+    # See how long it has been since the last time the script ran (And logged in to RouterOS)
+    if login_interval_throttled():
+        raise SyncError(f"Wait at least {config_defaults.login_interval_seconds} seconds between executions", -10)
+
+    # The serial port and RouterOS login take a few seconds. Do both while the pings run.
+    connection = _BackgroundConnect(timer)
+    connection.start()
+
+    # Ping a couple of things to make sure we are connected to the expected network
+    started = time.perf_counter()
+    lan_reachable = any(ping(host) for host in LAN_HOSTS)
+    timer.stage("ping LAN", started)
+
+    started = time.perf_counter()
+    mikro_device = connection.result()
+    timer.stage("wait for login", started)
+    print("Connected")
+
+    try:
+        record_login()
+        if not lan_reachable:
+            raise SyncError("Unable to locate any expected LAN devices.", -20)
+
+        # Set backup device to back to standby mode (I.E, change it back to 'switch mode')
+        started = time.perf_counter()
+        if not set_backup_router_to_standby(mikro_device):
+            raise SyncError("Mikrotik did not confirm standby mode", -25)
+        timer.stage("set standby", started)
+        timer.stage("time to standby", _process_start)
+        print("Pfsense operational. Mikrotik configured for standby mode")
+    finally:
+        mikro_device.disconnect()
+        print("Disconnected")
+
+
+def run_link_up():
+    """
+    Run main, then print the per-stage timings even if it failed
+    """
+    timer = StageTimer()
+    try:
+        run(main, timer)
+    finally:
+        timer.stage("total", _process_start)
+        timer.print()
+
+
+if __name__ == "__main__":
+    run_link_up()
@@ -2,83 +2,386 @@ from __future__ import annotations  # for Python 3.7-3.9
 
 from datetime import datetime
 from datetime import timedelta
-from os.path import isfile
 
 import sys
-import platform  # For getting the operating system name
-import subprocess  # For executing a shell command
 
 import config_defaults
 import config  # Pycharm says this is unused, but it is actually needed for overriding defaults
 import secrets
+import Errors
+import failback
+from Errors import SyncError
+from failback import login_interval_throttled
 from Mikrotik import MikrotikDHCPLease
 from Mikrotik import MikrotikDNSRecord
 from Mikrotik import MikrotikDevice
 from PFSense import PFSenseDevice
+from Shared import FingerprintHelper
+from StateStore import RouterStateStore
 
 
-# Credit to https://stackoverflow.com/questions/2953462/pinging-servers-in-python
-def ping(host):
+def pfsense_comment(record_hash: str) -> str:
+    return f"mode:router. Added by pfsense. hash:{record_hash}"
+
+
+def to_mikrotik_dns_record(pf_dns, record_hash: str) -> MikrotikDNSRecord:
+    return MikrotikDNSRecord(ip_address=pf_dns['ip_address'],
+                             hostname=pf_dns['hostname'],
+                             record_type=pf_dns['record_type'],
+                             disabled=True,
+                             comment=pfsense_comment(record_hash))
+
+
+def to_mikrotik_dhcp_lease(pf_lease, record_hash: str) -> MikrotikDHCPLease:
+    return MikrotikDHCPLease(mac_address=pf_lease['mac_address'],
+                             ip_address=pf_lease['ip_address'],
+                             hostname=pf_lease['hostname'],
+                             lease_duration=pf_lease['lease_duration'],
+                             disabled=True,
+                             comment=pfsense_comment(record_hash))
+
+
+def diff_hashes(wanted: dict[str, dict], present: dict[str, list[str]]) -> tuple[list[str], list[str], dict]:
     """
-    Returns True if host (str) responds to a ping request.
-    Remember that a host may not respond to a ping (ICMP) request even if the host name is valid.
+    Compute the changes needed to make the hash tagged records on RouterOS match the wanted records.
+
+    :param wanted: Dict of content hash -> record that should exist on RouterOS
+    :param present: Dict of content hash -> list of RouterOS .id that currently exist on RouterOS.
+    The list is empty when the .id is not known.
+    :return: Tuple of (RouterOS .ids to remove, content hashes to remove whose .id is not known,
+    dict of content hash -> record to add)
     """
+    remove_ids: list[str] = []
+    remove_hashes: list[str] = []
+    for record_hash, ids in present.items():
+        if record_hash in wanted:
+            # Keep one copy and remove any duplicates
+            remove_ids.extend(ids[1:])
+        elif ids:
+            remove_ids.extend(ids)
+        else:
+            remove_hashes.append(record_hash)
 
-    # Option for the number of packets as a function of
-    param = '-n' if platform.system().lower() == 'windows' else '-c'
+    add_records = {record_hash: record for record_hash, record in wanted.items() if record_hash not in present}
+    return remove_ids, remove_hashes, add_records
 
-    # Building the command. Ex: "ping -c 1 google.com"
-    command = ['ping', param, '1', host]
 
-    return subprocess.call(command) == 0
+def wanted_dns_records(pfsense_static_dns) -> dict[str, MikrotikDNSRecord]:
+    """
+    :return: Dict of content hash -> MikrotikDNSRecord that should exist on RouterOS
+    """
+    wanted_dns = {}
+    for pf_dns in pfsense_static_dns:
+        record_hash = FingerprintHelper.record_hash(FingerprintHelper.dns_record_key(pf_dns))
+        wanted_dns[record_hash] = to_mikrotik_dns_record(pf_dns, record_hash)
+    return wanted_dns
 
 
-def set_backup_router_to_standby(backup_router: MikrotikDevice):
+def wanted_dhcp_leases(pfsense_static_leases) -> dict[str, MikrotikDHCPLease]:
     """
-    Set the configuration of the backup Mikrotik device back to the 'standby' / 'switch' configuration.
-    :return: True if successful, False otherwise
+    :return: Dict of content hash -> MikrotikDHCPLease that should exist on RouterOS
     """
-    in_standby_config = False
-    backup_router.send_command(":global mode switch")
-    res = backup_router.send_command(":put $mode")
+    wanted_leases = {}
+    for pf_lease in pfsense_static_leases:
+        record_hash = FingerprintHelper.record_hash(FingerprintHelper.dhcp_lease_key(pf_lease))
+        wanted_leases[record_hash] = to_mikrotik_dhcp_lease(pf_lease, record_hash)
+    return wanted_leases
 
-    if 'switch' in res.splitlines():
-        res = backup_router.send_command("/system/script/run setMode")
-        if "Setting configuration to switch mode!" in res and "Done configuring!" in res:
-            res = backup_router.send_command(":put [/interface/ethernet/get ether8 mac-address]")
-            if "18:FD:74:78:5D:DB" in res:
-                in_standby_config = True
 
-    return in_standby_config
+def replaced_records(store: RouterStateStore, kind: str, add_records: dict[str, dict], stale_hashes) -> dict[str, str]:
+    """
+    Pair records about to be added with stored records about to be removed that share a MAC address (leases) or
+    hostname (DNS records), falling back to the IP address. I.E, records whose content changed in pfSense rather than
+    records that were added or deleted.
+
+    :param kind: 'dns' or 'lease'
+    :param add_records: Dict of content hash -> record to add
+    :param stale_hashes: Content hashes of the stored records to remove
+    :return: Dict of added content hash -> stale content hash it replaces
+    """
+    unpaired = set(stale_hashes)
+    replaced = {}
+    for record_hash, record in add_records.items():
+        if not unpaired:
+            break
+        if kind == 'lease':
+            candidates = store.find_by_mac_address(record['mac_address']) if record['mac_address'] else []
+        else:
+            candidates = store.find_by_hostname(record['hostname']) if record['hostname'] else []
+        candidates += store.find_by_ip_address(record['ip_address'])
+        for row in candidates:
+            if row['kind'] == kind and row['record_hash'] in unpaired:
+                replaced[record_hash] = row['record_hash']
+                unpaired.remove(row['record_hash'])
+                break
+    return replaced
 
 
-def remove_pfsense_records_from_backup(backup_router: MikrotikDevice):
-    print("Removing pfsense dns records from mikrotik")
-    backup_router.remove_static_dns_with_comment_containing("Added by pfsense")
-    print("Removing pfsense dhcp leases from mikrotik")
-    backup_router.remove_reserved_leases_with_comment_containing("Added by pfsense")
+def open_state_store() -> RouterStateStore:
+    return RouterStateStore(config_defaults.state_db_file,
+                            config_defaults.serial_port if config_defaults.serial_port else "/dev/ttyU0")
 
 
-def add_static_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, backup_router):
-    print("Adding pfsense dns records to mikrotik backup")
-    for pf_dns in pfsense_static_dns:
+def reconciliation_due(store: RouterStateStore) -> bool:
+    """
+    :return: True if the state store has not been refreshed from RouterOS within full_reconcile_interval_hours
+    """
+    last_reconciled = store.last_reconciled()
+    return last_reconciled is None \
+        or datetime.now() - last_reconciled > timedelta(hours=config_defaults.full_reconcile_interval_hours)
 
-        mk_dns = MikrotikDNSRecord(ip_address=pf_dns['ip_address'],
-                                   hostname=pf_dns['hostname'],
-                                   record_type=pf_dns['record_type'],
-                                   disabled=True,
-                                   comment="mode:router. Added by pfsense.")
-        backup_router.write_static_dns_record(mk_dns)
 
-    print("Adding pfsense dhcp leases to mikrotik")
-    for pf_lease in pfsense_static_leases:
-        mk_lease = MikrotikDHCPLease(mac_address=pf_lease['mac_address'],
-                                     ip_address=pf_lease['ip_address'],
-                                     hostname=pf_lease['hostname'],
-                                     lease_duration=pf_lease['lease_duration'],
-                                     disabled=True,
-                                     comment="mode:router. Added by pfsense.")
-        backup_router.write_reserved_dhcp_lease(mk_lease)
+def write_records(store: RouterStateStore, kind: str, add_records: dict[str, dict], write_record):
+    """
+    Write records to RouterOS one at a time and store the ones written in a single transaction.
+    Records written before a failed write are still stored.
+
+    :param kind: 'dns' or 'lease'
+    :param add_records: Dict of content hash -> record to add
+    :param write_record: MikrotikDevice.write_static_dns_record or MikrotikDevice.write_reserved_dhcp_lease
+    """
+    written = []
+    try:
+        for record_hash, record in add_records.items():
+            if write_record(record):
+                written.append((record_hash, record))
+    finally:
+        store.put_many(kind, written)
+
+
+def sync_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, backup_router: MikrotikDevice,
+                                   store: RouterStateStore, store_matches_backup: bool):
+    """
+    Differential sync. Records whose hash is no longer wanted are removed and missing records are added.
+    When store_matches_backup, the changes are computed from the state store without reading RouterOS and records are
+    removed by hash tag. Otherwise only the .id and hash tag of the pfsense records are fetched from RouterOS, the
+    store is refreshed from them and records are removed by the .ids just read.
+    """
+    wanted_dns = wanted_dns_records(pfsense_static_dns)
+    wanted_leases = wanted_dhcp_leases(pfsense_static_leases)
+
+    if store_matches_backup:
+        print("Computing changes from the local state store")
+        # The store does not keep .ids, so diff_hashes returns every stale hash to be removed by hash tag
+        present_dns = {record_hash: [] for record_hash in store.hashes('dns')}
+        present_leases = {record_hash: [] for record_hash in store.hashes('lease')}
+    else:
+        print("Reconciling the local state store with RouterOS")
+        present_dns = backup_router.get_static_dns_hashes("Added by pfsense")
+        present_leases = backup_router.get_reserved_dhcp_hashes("Added by pfsense")
+        store.replace('dns', present_dns.keys(), wanted_dns)
+        store.replace('lease', present_leases.keys(), wanted_leases)
+        store.mark_reconciled()
+
+    remove_ids, remove_hashes, add_records = diff_hashes(wanted_dns, present_dns)
+    stale_hashes = [record_hash for record_hash in present_dns if record_hash not in wanted_dns]
+    print(f"Static DNS: removing {len(remove_ids) + len(remove_hashes)}, adding {len(add_records)}, "
+          f"of which {len(replaced_records(store, 'dns', add_records, stale_hashes))} changed")
+    backup_router.remove_static_dns_by_id(remove_ids)
+    backup_router.remove_static_dns_by_hash(remove_hashes)
+    store.remove('dns', stale_hashes)
+    write_records(store, 'dns', add_records, backup_router.write_static_dns_record)
+
+    remove_ids, remove_hashes, add_records = diff_hashes(wanted_leases, present_leases)
+    stale_hashes = [record_hash for record_hash in present_leases if record_hash not in wanted_leases]
+    print(f"DHCP Leases: removing {len(remove_ids) + len(remove_hashes)}, adding {len(add_records)}, "
+          f"of which {len(replaced_records(store, 'lease', add_records, stale_hashes))} changed")
+    backup_router.remove_reserved_dhcp_by_id(remove_ids)
+    backup_router.remove_reserved_dhcp_by_hash(remove_hashes)
+    store.remove('lease', stale_hashes)
+    write_records(store, 'lease', add_records, backup_router.write_reserved_dhcp_lease)
+
+
+def seed_state_store(store: RouterStateStore, wanted_dns: dict, wanted_leases: dict):
+    """
+    Replace the state store with the wanted records once RouterOS has been verified to hold exactly those records.
+    """
+    store.replace('dns', wanted_dns.keys(), wanted_dns)
+    store.replace('lease', wanted_leases.keys(), wanted_leases)
+    store.mark_reconciled()
+
+
+def build_sync_plan(pfsense_static_dns, pfsense_static_leases, store: RouterStateStore) -> tuple[list[str], str]:
+    """
+    Compile the changes needed to bring RouterOS from the state store to the pfsense records into a RouterOS script.
+    Records are removed by their hash tag, so the plan does not depend on RouterOS .ids.
+    If the store has never been reconciled with RouterOS, all pfsense records are removed and re-added.
+
+    :return: Tuple of (RouterOS script lines, human-readable summary)
+    """
+    wanted_dns = wanted_dns_records(pfsense_static_dns)
+    wanted_leases = wanted_dhcp_leases(pfsense_static_leases)
+    state_known = store.last_reconciled() is not None
+    script: list[str] = []
+
+    if not state_known:
+        script.append('/ip/dns/static/remove [find comment~"Added by pfsense"]')
+        script.append('/ip/dhcp-server/lease/remove [find comment~"Added by pfsense"]')
+        remove_dns, remove_leases = [], []
+        add_dns, add_leases = wanted_dns, wanted_leases
+    else:
+        present_dns = store.hashes('dns')
+        present_leases = store.hashes('lease')
+        remove_dns = [record_hash for record_hash in present_dns if record_hash not in wanted_dns]
+        remove_leases = [record_hash for record_hash in present_leases if record_hash not in wanted_leases]
+        add_dns = {record_hash: record for record_hash, record in wanted_dns.items() if record_hash not in present_dns}
+        add_leases = {record_hash: lease for record_hash, lease in wanted_leases.items()
+                      if record_hash not in present_leases}
+        script += [f'/ip/dns/static/remove [find comment~"hash:{record_hash}"]' for record_hash in remove_dns]
+        script += [f'/ip/dhcp-server/lease/remove [find comment~"hash:{record_hash}"]'
+                   for record_hash in remove_leases]
+
+    script += [MikrotikDevice.static_dns_add_command(record) for record in add_dns.values()]
+    script += [MikrotikDevice.dhcp_lease_add_command(lease) for lease in add_leases.values()]
+
+    # Changed records are listed once with '~' instead of as a removal and an addition
+    replaced_dns = replaced_records(store, 'dns', add_dns, remove_dns)
+    replaced_leases = replaced_records(store, 'lease', add_leases, remove_leases)
+
+    summary = f"Static DNS: removing {len(remove_dns) if state_known else 'all'}, adding {len(add_dns)}, " \
+              f"of which {len(replaced_dns)} changed\n" \
+              f"DHCP Leases: removing {len(remove_leases) if state_known else 'all'}, adding {len(add_leases)}, " \
+              f"of which {len(replaced_leases)} changed"
+    for record_hash, record in add_dns.items():
+        fields = f"{record['hostname']} {record['record_type']} {record['ip_address']}"
+        if record_hash in replaced_dns:
+            summary += f"\n~ dns   {fields} (was hash:{replaced_dns[record_hash]})"
+        else:
+            summary += f"\n+ dns   {fields}"
+    for record_hash, lease in add_leases.items():
+        fields = f"{lease['mac_address']} {lease['ip_address']} {lease['hostname']}"
+        if record_hash in replaced_leases:
+            summary += f"\n~ lease {fields} (was hash:{replaced_leases[record_hash]})"
+        else:
+            summary += f"\n+ lease {fields}"
+    summary += "".join(f"\n- dns   hash:{record_hash}" for record_hash in remove_dns
+                       if record_hash not in replaced_dns.values())
+    summary += "".join(f"\n- lease hash:{record_hash}" for record_hash in remove_leases
+                       if record_hash not in replaced_leases.values())
+
+    return script, summary
+
+
+def write_sync_plan():
+    """
+    Parse the pfSense records and the last known RouterOS state and write the RouterOS script needed to sync them to
+    config_defaults.plan_file. Does not touch the serial port.
+    """
+    pfsense_static_dns = PFSenseDevice.get_reserved_dns_records()
+    pfsense_static_leases = PFSenseDevice.get_reserved_dhcp_leases()
+    store = open_state_store()
+    try:
+        script, summary = build_sync_plan(pfsense_static_dns, pfsense_static_leases, store)
+    finally:
+        store.close()
+
+    with open(config_defaults.plan_file, 'w') as file:
+        file.write(f"# mikrotikSync plan generated {datetime.now().strftime('%m/%d/%Y, %H:%M:%S')}\n")
+        file.write("".join(f"# {line}\n" for line in summary.splitlines()))
+        file.write("".join(f"{line}\n" for line in script))
+
+    print(summary)
+    print(f"Plan written to {config_defaults.plan_file}")
+
+
+def read_sync_plan() -> str:
+    """
+    :return: Content of config_defaults.plan_file. Read before connecting so a missing plan does not cost a login.
+    :raises SyncError: The plan file does not exist or could not be read
+    """
+    try:
+        with open(config_defaults.plan_file, 'r') as file:
+            return file.read()
+    except OSError as e:
+        raise SyncError(f"Could not read {config_defaults.plan_file}. Run --plan first. {e}", -35) from e
+
+
+def apply_sync_plan(backup_router: MikrotikDevice, store: RouterStateStore, script: str):
+    """
+    Transfer the script written by write_sync_plan to RouterOS and /import it. Falls back to a differential sync if
+    the import fails or the resulting RouterOS state does not match the pfsense records.
+    """
+    pfsense_static_dns = PFSenseDevice.get_reserved_dns_records()
+    pfsense_static_leases = PFSenseDevice.get_reserved_dhcp_leases()
+    dns_fingerprint = FingerprintHelper.fingerprint(FingerprintHelper.dns_record_key(record)
+                                                    for record in pfsense_static_dns)
+    lease_fingerprint = FingerprintHelper.fingerprint(FingerprintHelper.dhcp_lease_key(lease)
+                                                      for lease in pfsense_static_leases)
+
+    if not backup_router.import_script("mikrotiksync_plan", script):
+        print("RouterOS failed to import plan. Falling back to a differential sync")
+        sync_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, backup_router, store, False)
+    elif get_backup_fingerprints(backup_router) != (dns_fingerprint, lease_fingerprint):
+        print("Plan was out of date. Falling back to a differential sync")
+        sync_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, backup_router, store, False)
+    else:
+        seed_state_store(store, wanted_dns_records(pfsense_static_dns), wanted_dhcp_leases(pfsense_static_leases))
+        print("Plan applied")
+
+
+def get_backup_fingerprints(backup_router: MikrotikDevice) -> tuple[str | None, str | None]:
+    """
+    :return: Tuple of (static DNS fingerprint, DHCP lease fingerprint) of the pfsense records on the backup router
+    """
+    return backup_router.get_static_dns_fingerprint("Added by pfsense"), \
+        backup_router.get_reserved_dhcp_fingerprint("Added by pfsense")
+
+
+def sync(backup_router: MikrotikDevice, store: RouterStateStore):
+    # Get pfsense records
+    pfsense_static_dns = PFSenseDevice.get_reserved_dns_records()
+    pfsense_static_leases = PFSenseDevice.get_reserved_dhcp_leases()
+    pfsense_dynamic_leases = PFSenseDevice.get_dynamic_dhcp_leases()
+    print("Pfsense records loaded")
+
+    expected_fingerprints = (
+        FingerprintHelper.fingerprint(FingerprintHelper.dns_record_key(record) for record in pfsense_static_dns),
+        FingerprintHelper.fingerprint(FingerprintHelper.dhcp_lease_key(lease) for lease in pfsense_static_leases))
+    store_fingerprints = (store.fingerprint('dns'), store.fingerprint('lease'))
+
+    synced = False
+    if config_defaults.fingerprint_verification:
+        backup_fingerprints = get_backup_fingerprints(backup_router)
+        # None means a fingerprint could not be produced (duplicates, mangled output, unknown store content), so two
+        # Nones matching says nothing about either side
+        store_matches_backup = None not in backup_fingerprints and backup_fingerprints == store_fingerprints \
+            and not reconciliation_due(store)
+        if backup_fingerprints == expected_fingerprints:
+            print("RouterOS records already match pfsense records. Skipping sync")
+            synced = True
+            if not store_matches_backup:
+                # RouterOS was verified to hold exactly the pfsense records, so they are its state
+                seed_state_store(store, wanted_dns_records(pfsense_static_dns),
+                                 wanted_dhcp_leases(pfsense_static_leases))
+    else:
+        store_matches_backup = False
+
+    if not synced:
+        # Remove stale and add missing pfsense records on RouterOS
+        sync_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, backup_router, store,
+                                       store_matches_backup)
+
+        if config_defaults.fingerprint_verification:
+            synced = get_backup_fingerprints(backup_router) == expected_fingerprints
+            if not synced:
+                print("RouterOS fingerprint mismatch after sync")
+                store.invalidate()
+
+    # Print pfsense records
+    print_list_dict(pfsense_static_dns, "Pfsense Static DNS")
+    print_list_dict(pfsense_static_leases, "Pfsense Static Leases")
+    print_list_dict(pfsense_dynamic_leases, "Pfsense Dynamic Leases")
+
+    if synced:
+        print("RouterOS fingerprints verified")
+    else:
+        # Get RouterOS records
+        mikrotik_static_dns = backup_router.get_static_dns_records()
+        mikrotik_static_leases = backup_router.get_reserved_dhcp_leases()
+
+        # Print RouterOS records
+        print_list_dict(mikrotik_static_dns, "Mikrotik Static DNS")
+        print_list_dict(mikrotik_static_leases, "Mikrotik Reserved Leases")
 
 
 def print_list_dict(data_list: list[dict], title=None):
@@ -101,24 +404,7 @@ def pretty_print_dict(data_dict: dict):
     print("")
 
 
-def login_interval_throttled():
-    if not isfile('last_login.txt'):
-        print("Info: last_login.txt does not exist.")
-        return False
-
-    with open('last_login.txt', 'r') as file:
-        content = file.read()
-        if not content or content == "" or content == "''":
-            print("Info: Ignoring empty last_login.txt")
-            return False
-
-        last_login = datetime.strptime(content, "%m/%d/%Y, %H:%M:%S")
-        if (datetime.now() - last_login) < timedelta(seconds=config_defaults.login_interval_seconds):
-            return True
-
-
 # TODO: Add some basic sys logging functionality for error monitoring, emails, etc
-# TODO: Handle diffs between Mikrotik and Pfsense. For now it is simple enough to just remove and recreate.
 # TODO: Remove cron polling and instead have the script only sync when there are changes made to `dhcpd.conf`,
 #  `dhcpd.leases`, or `host_entries.conf`
 # TODO: Synchronize dynamic leases and such as well
@@ -126,75 +412,73 @@ def login_interval_throttled():
 # TODO: Use a 'real' config file format
 
 def main(action):
-    assert action is not None
-    # See how long it has been since the last time the script ran (And logged in to RouterOS)
-    if login_interval_throttled():
-        print(f"Wait at least {config_defaults.login_interval_seconds} seconds between executions")
-        exit(-10)
-
-    mikro_device = MikrotikDevice()
-    # Connect and login to RouterOS
-    connected = mikro_device.connect(config_defaults.serial_port if config_defaults.serial_port else "/dev/ttyU0",
-                                     config_defaults.baud_rate if config_defaults.baud_rate else 115200,
-                                     secrets.routeros_username, secrets.routeros_password)
-    if not connected:
-        print("Serial port or login failure.")
-        exit(-15)
-    print("Connected")
-    with open('last_login.txt', 'w') as _file:
-        _file.write(datetime.now().strftime("%m/%d/%Y, %H:%M:%S"))
-
-    if action == "sync":
-        # Get pfsense records
-        pfsense_static_dns = PFSenseDevice.get_reserved_dns_records()
-        pfsense_static_leases = PFSenseDevice.get_reserved_dhcp_leases()
-        pfsense_dynamic_leases = PFSenseDevice.get_dynamic_dhcp_leases()
-        print("Pfsense records loaded")
-
-        # Clear all add pfsense records added to RouterOS
-        remove_pfsense_records_from_backup(mikro_device)
-
-        # Add current Pfsense records
-        add_static_pfsense_records_to_backup(pfsense_static_dns, pfsense_static_leases, mikro_device)
-
-        # Print pfsense records
-        print_list_dict(pfsense_static_dns, "Pfsense Static DNS")
-        print_list_dict(pfsense_static_leases, "Pfsense Static Leases")
-        print_list_dict(pfsense_dynamic_leases, "Pfsense Dynamic Leases")
+    if action is None:
+        raise ValueError("action is required")
+    if action == "plan":
+        # Offline. Does not need the serial port or the login throttle
+        write_sync_plan()
+        return
 
-        # Get RouterOS records
-        mikrotik_static_dns = mikro_device.get_static_dns_records()
-        mikrotik_static_leases = mikro_device.get_reserved_dhcp_leases()
+    plan_script = read_sync_plan() if action == "apply" else None
 
-        # Print RouterOS records
-        print_list_dict(mikrotik_static_dns, "Mikrotik Static DNS")
-        print_list_dict(mikrotik_static_leases, "Mikrotik Reserved Leases")
+    # See how long it has been since the last time the script ran (And logged in to RouterOS)
+    if login_interval_throttled():
+        raise SyncError(f"Wait at least {config_defaults.login_interval_seconds} seconds between executions", -10)
+
+    mikro_device = MikrotikDevice(command_timeout_seconds=config_defaults.command_timeout_seconds,
+                                  export_timeout_seconds=config_defaults.export_timeout_seconds,
+                                  resync_attempts=config_defaults.resync_attempts)
+    try:
+        # Connect and login to RouterOS
+        mikro_device.connect(config_defaults.serial_port if config_defaults.serial_port else "/dev/ttyU0",
+                             config_defaults.baud_rate if config_defaults.baud_rate else 115200,
+                             secrets.routeros_username, secrets.routeros_password)
+        print("Connected")
+        run_action(action, mikro_device, plan_script)
+    finally:
+        mikro_device.disconnect()
+        print("Disconnected")
+
+
+def run_action(action, mikro_device: MikrotikDevice, plan_script: str = None):
+    """
+    Run action on a connected and logged in RouterOS device
 
-    # Script has been, presumably, called from /etc/devd in response to a LINK_UP event
-    elif action == "link_up":
-        # Ping a couple of things to make sure we are connected to the expected network
-        if ping("10.0.0.2") or ping("10.0.0.3") or ping("10.0.0.20"):
-            # Set backup device to back to standby mode (I.E, change it back to 'switch mode')
-            standby_mode = set_backup_router_to_standby(mikro_device)
-            assert standby_mode is True
-            print("Pfsense operational. Mikrotik configured for standby mode")
-        else:
-            print("Unable to locate any expected LAN devices.")
-            exit(-20)
+    :param plan_script: Content of the plan file for the 'apply' action. See read_sync_plan
+    """
+    failback.record_login()
+
+    if action == "sync" or action == "apply":
+        store = open_state_store()
+        try:
+            if action == "sync":
+                sync(mikro_device, store)
+            else:
+                apply_sync_plan(mikro_device, store, plan_script)
+        finally:
+            store.close()
 
     else:
-        print("Invalid action")
-        exit(-30)
+        raise SyncError("Invalid action", -30)
+
 
-    mikro_device.disconnect()
-    print("Disconnected")
+def run(action):
+    """
+    Run main and convert errors into exit codes for cron and devd
+    """
+    Errors.run(main, action)
 
 
 if __name__ == "__main__":
     if "--sync" in sys.argv:
-        main("sync")
+        run("sync")
     elif "--link_up" in sys.argv:
-        main("link_up")
+        # Same as running failback.py, which starts faster since it does not import the sync modules
+        failback.run_link_up()
+    elif "--plan" in sys.argv:
+        run("plan")
+    elif "--apply" in sys.argv:
+        run("apply")
     else:
         print("Usage: main.py ACTION")
         print("")
@@ -203,3 +487,7 @@ if __name__ == "__main__":
         print("Synchronize pfSense records to the backup RouterOS device")
         print("--link_up")
         print("Indicates to script that the network link is back up and sets the RouterOS device into 'switch mode'")
+        print("--plan")
+        print("Write the RouterOS script needed to sync pfSense records, without connecting to the RouterOS device")
+        print("--apply")
+        print("Transfer the script written by --plan to the backup RouterOS device in bulk and import it")
@@ -0,0 +1,226 @@
+"""
+| Generates synthetic pfSense and RouterOS data for benchmarking the parsers at scale.
+|
+| Usage: synthetic_data.py OUTPUT_DIR [HOSTS] [SEED]
+|
+| Writes dhcpd.conf, dhcpd.leases, host_entries.conf, dns_static_export.txt and dhcp_lease_export.txt to OUTPUT_DIR.
+| The export files mimic the console output of '/ip/dns/static export terse' and
+| '/ip/dhcp-server/lease export terse', including the echoed command and trailing prompt.
+"""
+from __future__ import annotations  # for Python 3.7-3.9
+from datetime import datetime
+from datetime import timedelta
+from os import makedirs
+from os.path import join
+
+import random
+import sys
+
+DOMAIN_NAME = "lan"
+TERMINAL_PROMPT = "[admin@MikroTik] > "
+
+
+def _mac_address(index: int, prefix: str = "02:00") -> str:
+    return prefix + "".join(f":{byte:02x}" for byte in index.to_bytes(4, "big"))
+
+
+def _ip_address(index: int, base: int = 10) -> str:
+    # Spread addresses over 10.x.y.z, skipping .0 and .255
+    return f"10.{base + index // 64516 % 200}.{index // 254 % 254 + 1}.{index % 254 + 1}"
+
+
+def _hostname(index: int) -> str:
+    return f"host-{index:06d}"
+
+
+def generate_dhcpd_conf(hosts: int, interfaces: int = 4) -> str:
+    """
+    :param hosts: Number of static mapping host blocks
+    :param interfaces: Number of DHCP enabled interfaces. Each interface has its own class and subnet.
+    :return: dhcpd.conf in the format written by pfSense
+    """
+    lines = [
+        f'option domain-name "{DOMAIN_NAME}";',
+        "option ldap-server code 95 = text;",
+        "option arch code 93 = unsigned integer 16; # RFC4578",
+        "default-lease-time 7200;",
+        "max-lease-time 86400;",
+        "log-facility local7;",
+        "one-lease-per-client true;",
+        "deny duplicates;",
+        "ping-check true;",
+        "update-conflict-detection false;",
+        "authoritative;",
+    ]
+
+    for interface in range(interfaces):
+        lines += [
+            f'class "s_opt{interface}" {{',
+            "\tmatch pick-first-value (option dhcp-client-identifier, hardware);",
+            "}",
+            "",
+            f"subnet 10.{10 + interface}.0.0 netmask 255.255.0.0 {{",
+            "\tpool {",
+            f"\t\trange 10.{10 + interface}.200.1 10.{10 + interface}.250.254;",
+            "\t}",
+            "",
+            f"\toption routers 10.{10 + interface}.0.1;",
+            f'\toption domain-name "{DOMAIN_NAME}";',
+            f"\toption domain-name-servers 10.{10 + interface}.0.1;",
+            "}",
+            "",
+        ]
+
+        for index in range(interface, hosts, interfaces):
+            lines += [
+                f"host s_opt{interface}_{index // interfaces} {{",
+                f"\thardware ethernet {_mac_address(index)};",
+                f"\tfixed-address {_ip_address(index)};",
+                f'\toption host-name "{_hostname(index)}";',
+                "}",
+                "",
+            ]
+
+    return "\n".join(lines) + "\n"
+
+
+def generate_dhcpd_leases(leases: int, renewals: int = 3, seed: int = 0) -> str:
+    """
+    :param leases: Number of distinct dynamic leases
+    :param renewals: Maximum number of times a lease is repeated in the journal
+    :param seed: Random seed
+    :return: dhcpd.leases journal in the format written by ISC dhcpd
+    """
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    lines = ["# The format of this file is documented in the dhcpd.leases(5) manual page.",
+             "# This lease file was written by isc-dhcp-4.4.2-P1",
+             "",
+             "# authoring-byte-order entry is generated, DO NOT DELETE",
+             "authoring-byte-order little-endian;",
+             ""]
+
+    journal = [index for index in range(leases) for _ in range(rng.randint(1, renewals))]
+    rng.shuffle(journal)
+    for entry, index in enumerate(journal):
+        lease_start = start + timedelta(minutes=entry)
+        lease_end = lease_start + timedelta(hours=2)
+        lines += [
+            f"lease {_ip_address(index, base=100)} {{",
+            f"  starts {lease_start.isoweekday() % 7} {lease_start:%Y/%m/%d %H:%M:%S};",
+            f"  ends {lease_end.isoweekday() % 7} {lease_end:%Y/%m/%d %H:%M:%S};",
+            f"  cltt {lease_start.isoweekday() % 7} {lease_start:%Y/%m/%d %H:%M:%S};",
+            "  binding state active;",
+            "  next binding state free;",
+            "  rewind binding state free;",
+            f"  hardware ethernet {_mac_address(index, prefix='06:00')};",
+            f'  uid "\\001\\006\\000{index:08x}";',
+        ]
+        # Not every client sends a hostname
+        if index % 5:
+            lines.append(f'  client-hostname "dyn-{index:06d}";')
+        lines += ["}", ""]
+
+    return "\n".join(lines) + "\n"
+
+
+def generate_host_entries(hosts: int, aliases: int = 1) -> str:
+    """
+    :param hosts: Number of hosts
+    :param aliases: Number of additional DNS aliases per host
+    :return: host_entries.conf in the format written by pfSense for unbound
+    """
+    lines = [f'local-zone: "{DOMAIN_NAME}." transparent',
+             'local-data-ptr: "127.0.0.1 localhost"',
+             'local-data: "localhost. A 127.0.0.1"',
+             f'local-data: "localhost.{DOMAIN_NAME}. A 127.0.0.1"',
+             f'local-data-ptr: "10.0.0.1 pfsense.{DOMAIN_NAME}"',
+             f'local-data: "pfsense.{DOMAIN_NAME}. A 10.0.0.1"']
+
+    for index in range(hosts):
+        ip_address = _ip_address(index)
+        lines += [f'local-data-ptr: "{ip_address} {_hostname(index)}.{DOMAIN_NAME}"',
+                  f'local-data: "{_hostname(index)}.{DOMAIN_NAME}. A {ip_address}"']
+        for alias in range(aliases):
+            lines.append(f'local-data: "alias{alias}-{_hostname(index)}.{DOMAIN_NAME}. A {ip_address}"')
+
+    return "\n".join(lines) + "\n"
+
+
+def _export_header(command: str) -> list[str]:
+    return [f"{TERMINAL_PROMPT}{command}",
+            "# oct/19/2026 12:00:00 by RouterOS 7.5",
+            "# software id = ABCD-1234",
+            "#",
+            "# model = RB5009UPr+S+",
+            "# serial number = HCQ000000000"]
+
+
+def generate_dns_static_export(records: int) -> str:
+    """
+    :param records: Number of static DNS records
+    :return: Console output of '/ip/dns/static export terse'
+    """
+    lines = _export_header("/ip/dns/static export terse")
+    for index in range(records):
+        lines.append(f"/ip dns static add address={_ip_address(index)} "
+                     f"comment=\"mode:router. Added by pfsense. hash:{index:010x}\" disabled=yes "
+                     f"name={_hostname(index)}.{DOMAIN_NAME}")
+    # RouterOS returns the cursor to the start of the line before redrawing the prompt
+    lines.append(f"\r{TERMINAL_PROMPT}")
+    return "\r\n".join(lines)
+
+
+def generate_dhcp_lease_export(leases: int) -> str:
+    """
+    :param leases: Number of static DHCP leases
+    :return: Console output of '/ip/dhcp-server/lease export terse'
+    """
+    lines = _export_header("/ip/dhcp-server/lease export terse")
+    for index in range(leases):
+        lines.append(f"/ip dhcp-server lease add address={_ip_address(index)} "
+                     f"comment=\"mode:router. Added by pfsense. hash:{index:010x}\" disabled=yes "
+                     f"lease-time=2h mac-address={_mac_address(index).upper()}")
+    # RouterOS returns the cursor to the start of the line before redrawing the prompt
+    lines.append(f"\r{TERMINAL_PROMPT}")
+    return "\r\n".join(lines)
+
+
+def write_dataset(output_dir: str, hosts: int, seed: int = 0) -> dict[str, str]:
+    """
+    Write a complete synthetic dataset to output_dir
+
+    :param output_dir: Directory to write the files to. Created if it does not exist.
+    :param hosts: Number of hosts. Used as the record count for every generated file.
+    :param seed: Random seed
+    :return: Dict of dataset name -> file path
+    """
+    makedirs(output_dir, exist_ok=True)
+    files = {
+        "dhcpd_conf": ("dhcpd.conf", generate_dhcpd_conf(hosts)),
+        "dhcpd_leases": ("dhcpd.leases", generate_dhcpd_leases(hosts, seed=seed)),
+        "host_entries": ("host_entries.conf", generate_host_entries(hosts)),
+        "dns_static_export": ("dns_static_export.txt", generate_dns_static_export(hosts)),
+        "dhcp_lease_export": ("dhcp_lease_export.txt", generate_dhcp_lease_export(hosts)),
+    }
+
+    paths = {}
+    for name, (file_name, content) in files.items():
+        paths[name] = join(output_dir, file_name)
+        # newline='' so the \r\n in the exports are preserved as-is
+        with open(paths[name], 'w', newline='') as writer:
+            writer.write(content)
+
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: synthetic_data.py OUTPUT_DIR [HOSTS] [SEED]")
+        sys.exit(1)
+
+    dataset = write_dataset(sys.argv[1],
+                            int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+                            int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    for dataset_path in dataset.values():
+        print(dataset_path)